@@ -1,65 +1,141 @@
 import gradio as gr
-from tutor import explain_error, load_model
+from inference import load_model, configure_cache, enable_retrieval, stream_explanation
+from scheduler import MicroBatchScheduler
+from diagnostics import diagnose_source, error_prompts
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import subprocess
+import tempfile
 import os
 
-# --- 1. LOAD THE MODEL (ONCE!) ---
-load_model()
-
 # --- Configuration ---
-TEMP_FILE = "_app_temp.cpp"  # A temporary file to compile
+SOURCE_NAME = "your_code.cpp"  # File name the user's code gets inside its temp directory
 COMPILER = "g++"             # The compiler to use
+MODEL_PATH = "./fine_tuned_t5_compiler_tutor"
+MODEL_BACKEND = "pytorch"    # "pytorch", "int8" or "onnx" (point MODEL_PATH at the convert_model.py output)
+MAX_CONCURRENT_COMPILES = os.cpu_count() or 2  # g++ processes allowed to run at once
+COMPILE_TIMEOUT = 10         # Seconds one submission may spend compiling, over all stages together
+MAX_BATCH_SIZE = 8           # Max concurrent explanations coalesced into one generate call
+MAX_WAIT_MS = 10             # How long a request waits for others to join its batch
+MAX_EXPLAINED = 3            # Distinct errors explained per submission
+# Streaming the root-cause explanation word by word (greedy) shows text sooner, but each
+# streamed request holds the model for its whole generation instead of joining a
+# scheduler batch, so under load it gives up the batching above. Off by default.
+STREAM_TOKENS = False
+CACHE_DB_PATH = "explanation_cache.sqlite3"  # On-disk explanation cache, survives restarts
+RETRIEVAL_INDEX = "retrieval_index"  # Built by retrieval.py; used only if present
+
+# --- 1. LOAD THE MODEL (ONCE!) ---
+load_model(MODEL_PATH, MODEL_BACKEND)
+configure_cache(db_path=CACHE_DB_PATH)
+if os.path.isdir(RETRIEVAL_INDEX):
+    enable_retrieval(RETRIEVAL_INDEX)
+SCHEDULER = MicroBatchScheduler(max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS).start()
+COMPILE_POOL = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_COMPILES, thread_name_prefix="compile")
 
-def compile_and_explain(code_string):
+def compile_code(code_string):
     """
-    This new function will:
-    1. Take the user's C++ code as a string.
-    2. Save it to a temp file.
-    3. Run g++ and capture the error.
-    4. Clean the error.
-    5. Call your AI model for the explanation.
+    Compiles one submission in its own temporary directory, so concurrent users
+    never share a file, and returns the CompileReport.
+    Runs on COMPILE_POOL, which bounds how many compilers run at the same time.
+    Uses the staged -fsyntax-only -> -c -> link pipeline so most errors come back
+    without paying for code generation or linking.
     """
-    
-    # 1. Save code to a temp file
-    try:
-        with open(TEMP_FILE, "w", encoding="utf-8") as f:
+    with tempfile.TemporaryDirectory(prefix="cpp_tutor_") as workdir:
+        with open(os.path.join(workdir, SOURCE_NAME), "w", encoding="utf-8") as f:
             f.write(code_string)
+
+        report = diagnose_source(SOURCE_NAME, cwd=workdir, compiler=COMPILER, timeout=COMPILE_TIMEOUT)
+
+    print(f"Compile stages: {report.format_timings()}")
+    return report
+
+def render_explanations(prompts, explanations):
+    """Markdown with one section per explained diagnostic, in root-cause order."""
+    if len(prompts) == 1:
+        return explanations[0]
+    sections = []
+    for number, ((diagnostic, _), explanation) in enumerate(zip(prompts, explanations), start=1):
+        title = f"`{diagnostic.location()}`: {diagnostic.message}" if diagnostic else "Compiler error"
+        sections.append(f"### {number}. {title}\n\n{explanation}")
+    return "\n\n".join(sections)
+
+async def explain_prompt(index, prompt):
+    """Sends one prompt through the scheduler; returns (index, text) so results can stream in any order."""
+    try:
+        return index, await asyncio.wrap_future(SCHEDULER.submit(prompt))
     except Exception as e:
-        return f"Error writing temp file: {e}", ""
+        return index, f"Error calling AI model: {e}"
 
-    # 2. Run the compiler
-    result = subprocess.run(
-        [COMPILER, TEMP_FILE],
-        capture_output=True,
-        text=True
-    )
-    
-    # 3. Clean up the temp file
-    if os.path.exists(TEMP_FILE):
-        os.remove(TEMP_FILE)
-            
-    full_error = result.stderr
+async def compile_and_explain(code_string):
+    """
+    This new function will:
+    1. Take the user's C++ code as a string.
+    2. Compile it in an isolated temp directory on the compile pool.
+    3. Capture the error.
+    4. Split it into distinct diagnostics and rank the root cause first.
+    5. Call your AI model for the explanations through the batching scheduler,
+       showing each as it completes (with STREAM_TOKENS the root cause is
+       streamed token by token instead, outside the scheduler).
+    Both the compile and the explanations are awaited, so a slow request doesn't
+    hold a Gradio worker thread while it waits.
+    """
+    loop = asyncio.get_running_loop()
+
+    # 1-3. Compile in the pool
+    try:
+        report = await loop.run_in_executor(COMPILE_POOL, compile_code, code_string)
+    except subprocess.TimeoutExpired:
+        yield f"Compilation timed out after {COMPILE_TIMEOUT} seconds.", ""
+        return
+    except OSError as e:
+        yield f"Error running the compiler: {e}", ""
+        return
     
-    # 4. Check if compilation was successful
-    if not full_error:
-        return "--- Compile Successful! ---", "No errors found."
+    full_error = report.stderr
+
+    # 4. Check if compilation was successful; a crashed compiler may print nothing we can parse, or nothing at all
+    if report.returncode == 0 and not full_error:
+        yield "--- Compile Successful! ---", "No errors found."
+        return
+    if report.returncode != 0 and not full_error.strip():
+        full_error = f"{COMPILER} exited with code {report.returncode} without printing a diagnostic."
             
-    # 5. Clean the error (to remove system noise)
-    clean_error = ""
-    for line in full_error.splitlines():
-        if TEMP_FILE in line: # Only keep lines that reference our temp file
-            clean_error += line.replace(TEMP_FILE, "your_code.cpp") + "\n"
+    # 5. One prompt per distinct root-cause error, each with its relevant notes
+    prompts = error_prompts(report.diagnostics, MAX_EXPLAINED)
     
-    if not clean_error: # Fallback if no lines matched (e.g., linker error)
-        clean_error = full_error
+    if not prompts: # Fallback if nothing could be parsed
+        prompts = [(None, full_error)]
             
-    # 6. Get the AI explanation
-    try:
-        friendly_explanation = explain_error(clean_error)
-        # Return both the original error and the friendly one
-        return full_error, friendly_explanation
-    except Exception as e:
-        return full_error, f"Error calling AI model: {e}"
+    # 6. Get the AI explanations; the scheduler batches them into one generate call
+    explanations = ["_Explaining..._"] * len(prompts)
+    yield full_error, render_explanations(prompts, explanations)
+
+    # Queue the batched explanations first so they're ready right after the stream
+    first_batched = 1 if STREAM_TOKENS else 0
+    pending = [
+        asyncio.ensure_future(explain_prompt(index, prompt))
+        for index, (_, prompt) in enumerate(prompts) if index >= first_batched
+    ]
+
+    if STREAM_TOKENS:
+        stream = stream_explanation(prompts[0][1])
+        streamed = ""
+        try:
+            while True:
+                piece = await loop.run_in_executor(None, next, stream, None)
+                if piece is None:
+                    break
+                streamed += piece
+                explanations[0] = streamed
+                yield full_error, render_explanations(prompts, explanations)
+        except Exception as e:
+            explanations[0] = f"Error calling AI model: {e}"
+            yield full_error, render_explanations(prompts, explanations)
+
+    for next_done in asyncio.as_completed(pending):
+        index, explanations[index] = await next_done
+        yield full_error, render_explanations(prompts, explanations)
 
 # --- 2. Create the Web Interface (V2) ---
 iface = gr.Interface(
@@ -75,6 +151,7 @@ iface = gr.Interface(
     ],
     
     title="C++ AI Tutor (v2.0)",
+    concurrency_limit=max(MAX_BATCH_SIZE, MAX_CONCURRENT_COMPILES),  # Let requests overlap so compiles run in parallel and explanations batch
     description="Write your C++ code, and this will compile it and explain any errors.",
     examples=[
         ["#include <iostream>\n\nint main() {\n    cout << \"Hello\";\n    return 0;\n}"],
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import argparse
+import difflib
+import statistics
+from inference import ModelSession, MODEL_PATH
+
+# --- Configuration ---
+DATASET_PATH = "error_dataset.json"
+
+def load_samples(path, count, from_end=False):
+    """Returns `count` error messages from the start (or the held-out tail) of a dataset file."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    items = data[-count:] if from_end else data[:count]
+    return [item["error_message"] for item in items]
+
+def current_rss_mb():
+    """Resident memory of this process in MB (Linux only, 0 elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+def directory_size_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / 2**20
+
+def summarize(name, timings):
+    """Prints mean/median/min per-request latency for one benchmark path."""
+    print(f"{name:<6} | requests: {len(timings):>3} | "
+          f"mean: {statistics.mean(timings):.3f}s | "
+          f"median: {statistics.median(timings):.3f}s | "
+          f"min: {min(timings):.3f}s")
+
+def bench_cold(model_path, samples):
+    """The old behaviour: load the tokenizer and weights again for every request."""
+    timings = []
+    for error_message in samples:
+        start = time.perf_counter()
+        session = ModelSession(model_path)
+        session.explain(error_message)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def bench_warm(model_path, samples):
+    """The session path: load once, then every request reuses the resident model."""
+    session = ModelSession(model_path)
+    print(f"Warm session loaded in {session.load_seconds:.3f}s (paid once)")
+    timings = []
+    for error_message in samples:
+        start = time.perf_counter()
+        session.explain(error_message)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def bench_bulk(model_path, samples, batch_size):
+    """Throughput of one-at-a-time generation versus the length-bucketed batch API."""
+    session = ModelSession(model_path)
+
+    start = time.perf_counter()
+    for error_message in samples:
+        session.explain(error_message)
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    session.explain_batch(samples, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+
+    print("\n" + "="*30)
+    print(f"single | {len(samples)} records in {single_seconds:.2f}s | {len(samples) / single_seconds:.2f} records/s")
+    print(f"batch  | {len(samples)} records in {batch_seconds:.2f}s | {len(samples) / batch_seconds:.2f} records/s (batch size {batch_size})")
+    print(f"Speedup: {single_seconds / batch_seconds:.1f}x")
+    print("="*30)
+
+def bench_stream(model_path, samples):
+    """Time-to-first-token of greedy streaming versus waiting for the full beam search result."""
+    session = ModelSession(model_path)
+    first_token, stream_total, beam_total = [], [], []
+    for error_message in samples:
+        start = time.perf_counter()
+        first = None
+        for _ in session.stream(error_message):
+            if first is None:
+                first = time.perf_counter() - start
+        stream_total.append(time.perf_counter() - start)
+        first_token.append(first if first is not None else stream_total[-1])
+
+        start = time.perf_counter()
+        session.explain(error_message, num_beams=4)
+        beam_total.append(time.perf_counter() - start)
+
+    print("\n" + "="*30)
+    summarize("ttft", first_token)
+    summarize("stream", stream_total)
+    summarize("beam", beam_total)
+    print("="*30)
+
+def bench_backends(models, samples):
+    """
+    Latency, memory and output agreement of each backend against the first one
+    (normally the fp32 PyTorch model), on the same held-out error messages.
+    """
+    reference = None
+    rows = []
+    for backend, path in models:
+        rss_before = current_rss_mb()
+        session = ModelSession(path, backend=backend)
+        rss_delta = current_rss_mb() - rss_before
+
+        outputs, timings = [], []
+        for error_message in samples:
+            start = time.perf_counter()
+            outputs.append(session.explain(error_message))
+            timings.append(time.perf_counter() - start)
+
+        if reference is None:
+            reference = outputs
+        exact = sum(out == ref for out, ref in zip(outputs, reference)) / len(outputs)
+        similarity = statistics.mean(difflib.SequenceMatcher(None, out, ref).ratio() for out, ref in zip(outputs, reference))
+        rows.append((backend, statistics.median(timings), directory_size_mb(path), rss_delta, exact, similarity))
+        del session
+
+    print("\n" + "="*30)
+    print(f"{'backend':<8} | {'median':>8} | {'on disk':>9} | {'rss +':>9} | {'exact':>6} | {'similar':>7}")
+    for backend, median, disk, rss, exact, similarity in rows:
+        print(f"{backend:<8} | {median:>7.3f}s | {disk:>6.1f} MB | {rss:>6.1f} MB | {exact:>6.1%} | {similarity:>7.1%}")
+    print("="*30)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-request latency of the inference paths.")
+    parser.add_argument("--model", type=str, default=MODEL_PATH, help="Path to the fine-tuned model directory.")
+    parser.add_argument("--dataset", type=str, default=DATASET_PATH, help="Dataset to draw error messages from.")
+    parser.add_argument("--requests", type=int, default=5, help="Number of requests per path.")
+    parser.add_argument("--mode", choices=["session", "bulk", "stream", "backends"], default="session",
+                        help="'session' compares cold reloads with the warm session, 'bulk' compares single vs batched generation, "
+                             "'stream' measures time-to-first-token of greedy streaming against full beam search, "
+                             "'backends' compares fp32/int8/onnx latency, memory and output agreement.")
+    parser.add_argument("--int8_model", type=str, default=None, help="int8 model directory for --mode backends.")
+    parser.add_argument("--onnx_model", type=str, default=None, help="ONNX model directory for --mode backends.")
+    parser.add_argument("--batch_size", type=int, default=8, help="Bucket size for --mode bulk.")
+    args = parser.parse_args()
+
+    # The backend comparison is an accuracy check, so it uses the tail of the dataset as a held-out slice
+    samples = load_samples(args.dataset, args.requests, from_end=args.mode == "backends")
+    print(f"Benchmarking {len(samples)} requests against {args.model}")
+
+    if args.mode == "bulk":
+        bench_bulk(args.model, samples, args.batch_size)
+        return
+    if args.mode == "stream":
+        bench_stream(args.model, samples)
+        return
+    if args.mode == "backends":
+        models = [("pytorch", args.model)]
+        if args.int8_model:
+            models.append(("int8", args.int8_model))
+        if args.onnx_model:
+            models.append(("onnx", args.onnx_model))
+        bench_backends(models, samples)
+        return
+
+    cold = bench_cold(args.model, samples)
+    warm = bench_warm(args.model, samples)
+
+    print("\n" + "="*30)
+    summarize("cold", cold)
+    summarize("warm", warm)
+    print(f"Speedup (median): {statistics.median(cold) / statistics.median(warm):.1f}x")
+    print("="*30)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import argparse
+import torch
+from transformers import T5ForConditionalGeneration, AutoTokenizer
+from inference import MODEL_PATH, QUANTIZED_WEIGHTS, quantize_int8
+
+# --- Configuration ---
+INT8_SAVE_PATH = MODEL_PATH + "_int8"
+ONNX_SAVE_PATH = MODEL_PATH + "_onnx"
+
+def convert_int8(model_path, output_path):
+    """
+    Writes a dynamically quantized (int8 nn.Linear) copy of the model.
+    Quantized modules can't go through save_pretrained, so the state dict is
+    saved next to the config and tokenizer; inference.load_model(backend="int8")
+    rebuilds and loads it.
+    """
+    print(f"Quantizing {model_path} to int8...")
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = T5ForConditionalGeneration.from_pretrained(model_path)
+    model.eval()
+    quantized = quantize_int8(model)
+
+    os.makedirs(output_path, exist_ok=True)
+    model.config.save_pretrained(output_path)
+    tokenizer.save_pretrained(output_path)
+    torch.save(quantized.state_dict(), os.path.join(output_path, QUANTIZED_WEIGHTS))
+    print(f"int8 model saved to {output_path}")
+
+def convert_onnx(model_path, output_path):
+    """
+    Exports encoder, decoder and decoder-with-past ONNX graphs through optimum,
+    so generation reuses past key/values instead of re-running the whole decoder.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError:
+        print("Error: ONNX export needs optimum: pip install optimum[onnxruntime]")
+        return
+
+    print(f"Exporting {model_path} to ONNX...")
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_path, export=True, use_cache=True)
+    model.save_pretrained(output_path)
+    tokenizer.save_pretrained(output_path)
+    print(f"ONNX model saved to {output_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the fine-tuned model for faster CPU inference.")
+    parser.add_argument("--model", type=str, default=MODEL_PATH, help="Path to the fine-tuned fp32 model.")
+    parser.add_argument("--int8", nargs="?", const=INT8_SAVE_PATH, default=None,
+                        help=f"Write a dynamic int8 model (default path: {INT8_SAVE_PATH}).")
+    parser.add_argument("--onnx", nargs="?", const=ONNX_SAVE_PATH, default=None,
+                        help=f"Write an ONNX Runtime export (default path: {ONNX_SAVE_PATH}).")
+    args = parser.parse_args()
+
+    if not args.int8 and not args.onnx:
+        parser.error("nothing to do: pass --int8 and/or --onnx")
+
+    if args.int8:
+        convert_int8(args.model, args.int8)
+    if args.onnx:
+        convert_onnx(args.model, args.onnx)
+
+if __name__ == "__main__":
+    main()
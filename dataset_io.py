@@ -0,0 +1,211 @@
+import os
+import glob
+import gzip
+import json
+import hashlib
+import argparse
+import textwrap
+
+# --- Dataset format shared by every pipeline stage ---
+# A dataset is one or more files of records with the fields below. Two layouts
+# are read and written:
+# - JSONL (.jsonl): one record per line, streamed lazily in both directions;
+# - JSON arrays (.json): the original layout, written in json.dump(indent=2)
+#   form and still read everywhere (loaded one file at a time).
+# Either can be compressed (.gz, or .zst with the zstandard package) and split
+# into shards (name-00000.jsonl.gz, name-00001.jsonl.gz, ...); a directory or a
+# glob pattern reads every shard in name order.
+SCHEMA_FIELDS = ("id", "compiler", "error_type", "error_message", "explanation", "suggested_fix")
+FIX_FIELDS = ("type", "description", "code")
+DATASET_SUFFIXES = (".json", ".jsonl")
+COMPRESSION_SUFFIXES = (".gz", ".zst")
+SHARD_SIZE = 0  # Records per shard when writing (0 = a single file)
+
+class SchemaError(ValueError):
+    """A record is missing a field of the shared schema or has the wrong type."""
+
+def validate_record(record, where="record"):
+    """Raises SchemaError if `record` does not follow the shared schema."""
+    if not isinstance(record, dict):
+        raise SchemaError(f"{where}: expected an object, got {type(record).__name__}")
+    for field in SCHEMA_FIELDS:
+        if field not in record:
+            raise SchemaError(f"{where}: missing field '{field}'")
+        expected = dict if field == "suggested_fix" else str
+        if not isinstance(record[field], expected):
+            raise SchemaError(f"{where}: field '{field}' should be {expected.__name__}, got {type(record[field]).__name__}")
+    for field in FIX_FIELDS:
+        if not isinstance(record["suggested_fix"].get(field), str):
+            raise SchemaError(f"{where}: suggested_fix.{field} is missing or not a string")
+
+def split_suffix(path):
+    """'data/train-00001.jsonl.gz' -> ('data/train-00001', '.jsonl', '.gz')."""
+    base, compression = os.path.splitext(path)
+    if compression not in COMPRESSION_SUFFIXES:
+        base, compression = path, ""
+    base, layout = os.path.splitext(base)
+    return base, layout, compression
+
+def open_dataset_file(path, mode="rt"):
+    """Opens a dataset file as text, decompressing/compressing by suffix."""
+    _, _, compression = split_suffix(path)
+    if compression == ".gz":
+        return gzip.open(path, mode, encoding="utf-8")
+    if compression == ".zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading or writing .zst datasets needs the zstandard package: pip install zstandard")
+        return zstandard.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def dataset_files(source):
+    """Resolves a file, a shard directory or a glob pattern to a sorted list of dataset files."""
+    if os.path.isdir(source):
+        names = sorted(os.listdir(source))
+        files = [os.path.join(source, name) for name in names if split_suffix(name)[1] in DATASET_SUFFIXES]
+    elif glob.has_magic(source):
+        files = sorted(glob.glob(source))
+    else:
+        files = [source] if os.path.exists(source) else []
+    if not files:
+        raise FileNotFoundError(2, "No dataset files found", source)
+    return files
+
+def iter_file(path, validate=True):
+    """Yields the records of one dataset file; JSONL is read one line at a time."""
+    _, layout, _ = split_suffix(path)
+    with open_dataset_file(path) as f:
+        if layout == ".json":
+            for position, record in enumerate(json.load(f)):
+                if validate:
+                    validate_record(record, f"{path}[{position}]")
+                yield record
+            return
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if validate:
+                validate_record(record, f"{path}:{line_number}")
+            yield record
+
+class DatasetReader:
+    """
+    Re-iterable, lazy view over one or more dataset sources (files, shard
+    directories or glob patterns), in order. Every pass re-reads the files, so
+    corpora larger than RAM can be streamed as often as needed.
+    With dedup=True only the first record of each id is kept; only the ids
+    (and a short content digest, to spot conflicting records) are held in
+    memory. The counts of the last full pass are in `duplicates` and
+    `conflicts` (same id, different content).
+    """
+    def __init__(self, sources, validate=True, dedup=True):
+        if isinstance(sources, str):
+            sources = [sources]
+        self.files = [path for source in sources for path in dataset_files(source)]
+        self.validate = validate
+        self.dedup = dedup
+        self.duplicates = 0
+        self.conflicts = 0
+
+    def __iter__(self):
+        seen = {}
+        duplicates = conflicts = 0
+        for path in self.files:
+            for record in iter_file(path, self.validate):
+                if self.dedup:
+                    digest = hashlib.sha256(json.dumps(record, sort_keys=True).encode("utf-8")).digest()[:8]
+                    previous = seen.get(record["id"])
+                    if previous is not None:
+                        duplicates += 1
+                        conflicts += previous != digest
+                        continue
+                    seen[record["id"]] = digest
+                yield record
+        self.duplicates, self.conflicts = duplicates, conflicts
+
+def _write_file(path, records):
+    """Writes records to one file (atomically via a .tmp file); returns how many were written."""
+    _, layout, compression = split_suffix(path)
+    tmp_path = f"{path}.tmp{compression}"  # keeps the compression suffix for open_dataset_file
+    count = 0
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open_dataset_file(tmp_path, "wt") as f:
+        if layout == ".json":
+            # Same layout as json.dump(records, f, indent=2), written one record at a time
+            f.write("[")
+            for record in records:
+                f.write(",\n" if count else "\n")
+                f.write(textwrap.indent(json.dumps(record, indent=2), "  "))
+                count += 1
+            f.write("\n]" if count else "]")
+        else:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+                count += 1
+    os.replace(tmp_path, path)
+    return count
+
+def write_records(path, records, shard_size=SHARD_SIZE):
+    """
+    Writes an iterable of records to `path`; the layout and compression follow
+    its suffix. With shard_size > 0 the output is split into
+    <name>-00000<suffix>, <name>-00001<suffix>, ... of at most shard_size
+    records each. Returns (records written, list of files).
+    """
+    if not shard_size:
+        return _write_file(path, records), [path]
+    base, layout, compression = split_suffix(path)
+    records = iter(records)
+    total, files = 0, []
+    while True:
+        # Peek one record so an exact multiple of shard_size leaves no empty shard
+        first = next(records, None)
+        if first is None:
+            break
+        shard_path = f"{base}-{len(files):05d}{layout}{compression}"
+
+        def shard_records():
+            yield first
+            for _ in range(shard_size - 1):
+                record = next(records, None)
+                if record is None:
+                    return
+                yield record
+
+        total += _write_file(shard_path, shard_records())
+        files.append(shard_path)
+    return total, files
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate, convert and merge datasets.")
+    parser.add_argument("command", choices=["validate", "merge"], help="validate: check the schema; merge: combine sources into --output.")
+    parser.add_argument("sources", nargs="+", help="Dataset files, shard directories or glob patterns.")
+    parser.add_argument("--output", type=str, default=None, help="Merged dataset path (.json/.jsonl, optionally .gz/.zst).")
+    parser.add_argument("--shard_size", type=int, default=SHARD_SIZE, help="Records per output shard (0 = one file).")
+    parser.add_argument("--keep_duplicates", action="store_true", help="Keep every record even when ids repeat.")
+    args = parser.parse_args()
+
+    if args.command == "merge" and not args.output:
+        parser.error("merge needs --output")
+
+    try:
+        reader = DatasetReader(args.sources, dedup=not args.keep_duplicates)
+        if args.command == "validate":
+            count = sum(1 for _ in reader)
+            print(f"{count} valid records in {len(reader.files)} files")
+        else:
+            count, files = write_records(args.output, reader, args.shard_size)
+            print(f"Wrote {count} records to {', '.join(files)}")
+    except FileNotFoundError as e:
+        print(f"Error: {e.filename} not found. Make sure the dataset exists.")
+        return
+    except SchemaError as e:
+        print(f"Error: {e}")
+        return
+    if reader.duplicates:
+        print(f"Skipped {reader.duplicates} records with repeated ids ({reader.conflicts} with different content; the first was kept)")
+
+if __name__ == "__main__":
+    main()
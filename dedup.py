@@ -0,0 +1,135 @@
+import re
+import zlib
+import argparse
+import numpy as np
+from normalize import normalize_error, templatize
+from retrieval import TOKEN_RE
+from dataset_io import DatasetReader, SchemaError, write_records
+
+# --- Configuration ---
+NUM_PERM = 128      # MinHash permutations per record
+BANDS = 16          # LSH bands (NUM_PERM / BANDS rows each); 16 x 8 catches pairs from ~0.7 Jaccard up
+THRESHOLD = 0.8     # Estimated Jaccard similarity at which two records count as near-duplicates
+SHINGLE_SIZE = 3    # Tokens per shingle
+SEED = 42           # Fixes the hash permutations, so clusters are reproducible (and equal on all DDP ranks)
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+DIGITS_RE = re.compile(r"\d+")
+
+# --- Near-duplicate detection ---
+# Records of the same mistake differ only in file names, temp objects, line
+# numbers and the user's identifiers, so each record is canonicalized first
+# (normalize.py). MinHash turns a text's shingle set into NUM_PERM numbers whose
+# agreement rate estimates Jaccard similarity. Two records are near-duplicates
+# when both their diagnostics and their targets (explanation + fix) are; the
+# targets are compared separately because many share one long template and
+# would otherwise outweigh a different diagnostic. LSH only compares records
+# whose diagnostics share a whole band of numbers, which keeps clustering
+# roughly linear.
+
+def canonical_pair(record):
+    """(canonicalized error message, target text with the message's identifiers marked)."""
+    canonical, identifiers = normalize_error(record["error_message"])
+    target = record["explanation"] + " " + record["suggested_fix"]["description"]
+    return canonical, templatize(target, identifiers)
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    crc32 hashes of the token `size`-grams of `text` (the whole text if it is
+    shorter). Numbers become N, as the explanations repeat the line numbers.
+    """
+    tokens = TOKEN_RE.findall(DIGITS_RE.sub("N", text.lower()))
+    grams = {" ".join(tokens[i:i + size]) for i in range(max(len(tokens) - size + 1, 1))}
+    return np.array([zlib.crc32(gram.encode("utf-8")) for gram in grams], dtype=np.uint64)
+
+class MinHasher:
+    """MinHash signatures from NUM_PERM universal hash functions (a * x + b) mod p."""
+    def __init__(self, num_perm=NUM_PERM, seed=SEED):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, MAX_HASH, size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes):
+        # a, b and the shingle hashes are < 2^32, so a * x + b fits in uint64
+        permuted = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME
+        return (permuted.min(axis=0) & MAX_HASH).astype(np.uint32)
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two records from their signatures."""
+    return float(np.mean(sig_a == sig_b))
+
+def find_clusters(records, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS):
+    """
+    Assigns every record a cluster id: the position of the first record of its
+    near-duplicate cluster. Returns a list parallel to `records` (any iterable,
+    read once).
+    Records are visited in order; each one joins the most similar cluster
+    leader it shares an LSH band with, if both similarities reach `threshold`,
+    and otherwise becomes a leader itself. Only leaders go into the buckets and
+    every member is within `threshold` of its leader, so clusters cannot chain
+    unrelated records together through intermediate ones.
+    """
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+    hasher = MinHasher(num_perm)
+    rows = num_perm // bands
+    buckets = [{} for _ in range(bands)]
+    leaders = {}  # position -> (error signature, target signature)
+    clusters = []
+    for i, record in enumerate(records):
+        error, target = canonical_pair(record)
+        error_sig, target_sig = hasher.signature(shingles(error)), hasher.signature(shingles(target))
+        keys = [error_sig[band * rows:(band + 1) * rows].tobytes() for band in range(bands)]
+        candidates = {leader for band, key in enumerate(keys) for leader in buckets[band].get(key, ())}
+        best, best_score = None, threshold
+        for leader in sorted(candidates):
+            leader_error, leader_target = leaders[leader]
+            score = min(similarity(leader_error, error_sig), similarity(leader_target, target_sig))
+            if score >= best_score and (best is None or score > best_score):
+                best, best_score = leader, score
+        if best is None:
+            best = i
+            leaders[i] = (error_sig, target_sig)
+            for band, key in enumerate(keys):
+                buckets[band].setdefault(key, []).append(i)
+        clusters.append(best)
+    return clusters
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and remove near-duplicate records across datasets.")
+    parser.add_argument("datasets", nargs="*", default=["error_dataset.json", "generated_dataset.json", "scraped_dataset.json"],
+                        help="Dataset files, shard directories or glob patterns (merged, ids deduplicated).")
+    parser.add_argument("--output", type=str, default=None, help="Write one record per cluster here (.json/.jsonl, optionally .gz/.zst).")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Estimated Jaccard similarity that counts as a duplicate.")
+    parser.add_argument("--num_perm", type=int, default=NUM_PERM, help="MinHash permutations.")
+    parser.add_argument("--bands", type=int, default=BANDS, help="LSH bands (must divide --num_perm).")
+    parser.add_argument("--show", type=int, default=5, help="Largest clusters to print.")
+    args = parser.parse_args()
+
+    try:
+        records = list(DatasetReader(args.datasets))
+    except FileNotFoundError as e:
+        print(f"Error: {e.filename} not found. Make sure the dataset exists.")
+        return
+    except SchemaError as e:
+        print(f"Error: {e}")
+        return
+
+    clusters = find_clusters(records, args.threshold, args.num_perm, args.bands)
+    members = {}
+    for i, cluster in enumerate(clusters):
+        members.setdefault(cluster, []).append(i)
+    print(f"{len(records)} records form {len(members)} clusters ({len(records) - len(members)} near-duplicates)")
+
+    for cluster, indices in sorted(members.items(), key=lambda item: -len(item[1]))[:args.show]:
+        if len(indices) < 2:
+            break
+        first = records[cluster]
+        print(f"  {len(indices):4d} x {first['id']} | {first['error_type']} | {first['error_message'].splitlines()[-1][:70]}")
+
+    if args.output:
+        count, files = write_records(args.output, (records[cluster] for cluster in sorted(members)))
+        print(f"Wrote {count} records to {', '.join(files)}")
+
+if __name__ == "__main__":
+    main()
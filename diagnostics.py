@@ -0,0 +1,403 @@
+import os
+import re
+import json
+import subprocess
+import time
+from functools import lru_cache
+
+# --- Configuration ---
+COMPILER = "g++"
+SOURCE_EXTENSIONS = (".cpp", ".cc", ".cxx", ".c++", ".c")
+JSON_FORMAT_FLAG = "-fdiagnostics-format=json"
+MAX_NOTES = 3  # Notes kept under the primary error when building the model prompt
+MAX_EXPLAINED = 3  # Distinct diagnostics explained per compile
+SYSTEM_HEADER_PREFIXES = ("/usr/", "/opt/", "/Library/", "C:\\", "c:\\")
+
+# How the -fsyntax-only pre-check treats the user's flags. Options taking the next
+# word as their value keep it (preprocessor, language) or drop it with the flag
+# (output, dependency files, linker, assembler). Any option not listed here could
+# take a value we would misread, so the pre-check is skipped for that command.
+SYNTAX_FLAGS_WITH_VALUE = (
+    "-I", "-D", "-U", "-x", "-include", "-imacros", "-isystem", "-iquote", "-idirafter",
+    "-iprefix", "-iwithprefix", "-iwithprefixbefore", "-isysroot", "-imultilib", "--sysroot",
+    "-Xpreprocessor",
+)
+OUTPUT_FLAGS_WITH_VALUE = ("-o", "-MF", "-MT", "-MQ", "-Xlinker", "-Xassembler", "-l", "-L", "-T", "-u", "-z")
+OUTPUT_ONLY_FLAGS = ("-c", "-S", "-E", "-shared", "-static", "-pie", "-no-pie", "-rdynamic", "-s",
+                     "-M", "-MM", "-MD", "-MMD", "-MP", "-MG", "-v", "-pipe", "-save-temps")
+LINK_FLAG_PREFIXES = ("-l", "-L", "-Wl,", "-Wa,", "-o")
+SYNTAX_FLAG_PREFIXES = ("-W", "-f", "-O", "-g", "-m", "-std=", "--std=", "-D", "-U", "-I", "-x",
+                        "-pedantic", "-ansi", "-w", "-pthread", "-isystem", "-iquote", "-idirafter", "--sysroot=")
+
+class Diagnostic:
+    """
+    One compiler diagnostic: severity ("error", "fatal error", "warning", "note"),
+    message, optional location and the notes g++ attached to it.
+    """
+    def __init__(self, severity, message, file=None, line=None, column=None, option=None):
+        self.severity = severity
+        self.message = message
+        self.file = file
+        self.line = line
+        self.column = column
+        self.option = option
+        self.source_line = None  # The offending line of code, when we know it
+        self.children = []
+
+    @property
+    def is_error(self):
+        return self.severity in ("error", "fatal error")
+
+    @property
+    def in_system_header(self):
+        return bool(self.file) and self.file.startswith(SYSTEM_HEADER_PREFIXES)
+
+    def location(self):
+        parts = [str(part) for part in (self.file, self.line, self.column) if part is not None]
+        return ":".join(parts)
+
+    def render(self, max_notes=None, relevant_only=False):
+        """Formats the diagnostic the way g++ prints it in text mode."""
+        location = self.location()
+        header = f"{location}: " if location else ""
+        option = f" [{self.option}]" if self.option else ""
+        lines = [f"{header}{self.severity}: {self.message}{option}"]
+        if self.source_line is not None and self.line is not None:
+            lines.append(f"{self.line:>5} | {self.source_line}")
+
+        notes = self.children
+        if relevant_only:
+            notes = [note for note in notes if not note.in_system_header]
+        if max_notes is not None:
+            notes = notes[:max_notes]
+        for note in notes:
+            lines.append(note.render())
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return f"Diagnostic({self.severity!r}, {self.message!r}, {self.location()!r}, notes={len(self.children)})"
+
+# --- Parsers ---
+TEXT_DIAGNOSTIC_RE = re.compile(
+    r"^(?P<file>[^\s:][^:]*?|[A-Za-z]:[^:]*?):(?P<line>\d+):(?:(?P<column>\d+):)? "
+    r"(?P<severity>fatal error|error|warning|note): (?P<message>.*?)(?: \[(?P<option>-[Wf][^\]]+)\])?$"
+)
+TOOL_DIAGNOSTIC_RE = re.compile(r"^(?P<file>[^\s:]+): (?P<severity>fatal error|error|warning|note): (?P<message>.*)$")
+LINKER_REFERENCE_RE = re.compile(r"^(?P<file>[^\s:][^:]*):\([^)]*\): (?P<message>(?:undefined|multiple definition|first defined).*)$")
+# "/usr/bin/ld: cannot find -lfoo: ..." has no severity; "/usr/bin/ld: x.o: in function `main':" is only context
+LINKER_MESSAGE_RE = re.compile(r"^(?P<file>(?:\S*[/\\])?(?:ld|ld\.\w+)(?:\.exe)?): (?:(?P<severity>warning|error): )?(?P<message>.*)$")
+LINKER_CONTEXT_RE = re.compile(r": in function [`'].*':$|: in `.*':$")
+SOURCE_ECHO_RE = re.compile(r"^\s*(?P<line>\d+) \| (?P<code>.*)$")
+
+def _from_json(entry):
+    location = (entry.get("locations") or [{}])[0].get("caret", {})
+    diagnostic = Diagnostic(
+        entry.get("kind", "error"),
+        entry.get("message", "").strip(),
+        location.get("file"),
+        location.get("line"),
+        location.get("column"),
+        entry.get("option"),
+    )
+    diagnostic.children = [_from_json(child) for child in entry.get("children", [])]
+    return diagnostic
+
+def parse_text_diagnostics(text):
+    """
+    Parser for g++'s classic text output (the front-ends' default, the link stage
+    and the user's own build command). Notes are attached to the diagnostic they
+    follow; context headers ("In function ...") and caret lines are dropped.
+    Linker messages count as errors. A "collect2: ... ld returned" summary with
+    nothing above it to summarise gets the lines no pattern matched as its notes.
+    """
+    diagnostics = []
+    unparsed = []
+    for raw_line in text.splitlines():
+        line = raw_line.rstrip()
+        match = TEXT_DIAGNOSTIC_RE.match(line) or TOOL_DIAGNOSTIC_RE.match(line)
+        if match:
+            groups = match.groupdict()
+            diagnostic = Diagnostic(
+                groups["severity"],
+                groups["message"],
+                groups["file"],
+                int(groups["line"]) if groups.get("line") else None,
+                int(groups["column"]) if groups.get("column") else None,
+                groups.get("option"),
+            )
+        else:
+            match = LINKER_REFERENCE_RE.match(line) or LINKER_MESSAGE_RE.match(line)
+            if match and LINKER_CONTEXT_RE.search(line):
+                continue
+            if match:
+                diagnostic = Diagnostic(match.groupdict().get("severity") or "error", match.group("message"), match.group("file"))
+            else:
+                echo = SOURCE_ECHO_RE.match(line)
+                if echo:
+                    if diagnostics:
+                        last = diagnostics[-1].children[-1] if diagnostics[-1].children else diagnostics[-1]
+                        if last.line == int(echo.group("line")) and last.source_line is None:
+                            last.source_line = echo.group("code").strip()
+                elif line.strip() and not line.lstrip().startswith("|") and not line.endswith(":"):
+                    unparsed.append(line.strip())
+                continue
+
+        # "collect2: error: ld returned 1 exit status" only summarises the linker errors above it
+        is_summary = diagnostic.file == "collect2" and diagnostic.message.startswith("ld returned")
+        if (diagnostic.severity == "note" or is_summary) and diagnostics:
+            diagnostics[-1].children.append(diagnostic)
+        else:
+            if is_summary:
+                diagnostic.children = [Diagnostic("note", message) for message in unparsed]
+            diagnostics.append(diagnostic)
+    return diagnostics
+
+def parse_diagnostics(stderr):
+    """
+    Parses compiler stderr into Diagnostic records. Lines holding a JSON array
+    (from -fdiagnostics-format=json) are decoded directly; everything else, such
+    as linker output, goes through the text parser.
+    """
+    diagnostics = []
+    text_lines = []
+    for line in stderr.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("["):
+            try:
+                entries = json.loads(stripped)
+            except ValueError:
+                entries = None
+            if isinstance(entries, list):
+                diagnostics.extend(_from_json(entry) for entry in entries)
+                continue
+        if stripped and stripped != "compilation terminated.":
+            text_lines.append(line)
+    diagnostics.extend(parse_text_diagnostics("\n".join(text_lines)))
+    return diagnostics
+
+def attach_source_lines(diagnostics, file_name, source_text):
+    """Fills in source_line for diagnostics that point into `file_name`."""
+    source_lines = source_text.splitlines()
+    for diagnostic in diagnostics:
+        for item in [diagnostic] + diagnostic.children:
+            if item.file == file_name and item.line and 0 < item.line <= len(source_lines) and item.source_line is None:
+                item.source_line = source_lines[item.line - 1].strip()
+
+def render_diagnostics(diagnostics):
+    """Turns parsed diagnostics back into readable g++-style text."""
+    return "\n".join(diagnostic.render() for diagnostic in diagnostics)
+
+def _rank(diagnostic):
+    """
+    Sort key for likely root causes. A missing header (fatal error) breaks everything
+    after it; syntax errors ("expected ...") cause cascades further down; after that
+    source order wins, because later errors are usually fallout from earlier ones.
+    Linker errors have no line and only matter once the code compiles.
+    """
+    if diagnostic.severity == "fatal error":
+        tier = 0
+    elif diagnostic.message.startswith("expected"):
+        tier = 1
+    elif diagnostic.line is not None:
+        tier = 2
+    else:
+        tier = 3
+    return (tier, diagnostic.line or 0, diagnostic.column or 0)
+
+def select_root_causes(diagnostics, top_n=MAX_EXPLAINED):
+    """
+    Picks the diagnostics worth explaining from a (possibly long) cascade:
+    errors only (warnings if there are none), identical messages collapsed,
+    further errors on an already-reported line dropped as cascade, and the
+    rest ranked so the most probable root cause comes first.
+    """
+    candidates = [diagnostic for diagnostic in diagnostics if diagnostic.is_error]
+    if not candidates:
+        candidates = [diagnostic for diagnostic in diagnostics if diagnostic.severity == "warning"]
+
+    selected = []
+    seen_messages = set()
+    seen_lines = set()
+    for diagnostic in sorted(candidates, key=_rank):
+        line_key = (diagnostic.file, diagnostic.line)
+        if diagnostic.message in seen_messages:
+            continue
+        if diagnostic.line is not None and line_key in seen_lines:
+            continue
+        seen_messages.add(diagnostic.message)
+        seen_lines.add(line_key)
+        selected.append(diagnostic)
+    return selected[:top_n]
+
+def error_prompts(diagnostics, top_n=MAX_EXPLAINED, max_notes=MAX_NOTES):
+    """Model prompts for the top root-cause diagnostics, most likely cause first."""
+    return [
+        (diagnostic, diagnostic.render(max_notes=max_notes, relevant_only=True))
+        for diagnostic in select_root_causes(diagnostics, top_n)
+    ]
+
+def primary_error_prompt(diagnostics, max_notes=MAX_NOTES):
+    """
+    The text handed to the model for a single explanation: the most likely root-cause
+    error with only its relevant notes (those outside system headers).
+    """
+    prompts = error_prompts(diagnostics, 1, max_notes)
+    return prompts[0][1] if prompts else ""
+
+@lru_cache(maxsize=None)
+def supports_json_diagnostics(compiler=COMPILER):
+    """Checks once per compiler whether it accepts -fdiagnostics-format=json."""
+    try:
+        result = subprocess.run(
+            [compiler, JSON_FORMAT_FLAG, "-fsyntax-only", "-x", "c++", "-"],
+            input="", capture_output=True, text=True, timeout=30
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return result.returncode == 0
+
+class CompileReport:
+    """
+    What a staged compile produced: the diagnostics text, the exit code of the last
+    stage that ran, and how long every stage took.
+    """
+    def __init__(self):
+        self.stderr = ""
+        self.stdout = ""
+        self.diagnostics = []
+        self.returncode = 0
+        self.stage = None
+        self.timings = []  # (stage name, seconds)
+
+    @property
+    def total_seconds(self):
+        return sum(seconds for _, seconds in self.timings)
+
+    def format_timings(self):
+        stages = " | ".join(f"{name} {seconds:.3f}s" for name, seconds in self.timings)
+        return f"{stages} | total {self.total_seconds:.3f}s"
+
+def run_stage(report, name, command, cwd=None, deadline=None, sources=()):
+    """
+    Runs one compiler stage, recording its time on the report. result.stderr is
+    g++'s own output, and the parsed diagnostics (with their offending lines from
+    `sources`) are left on result.diagnostics.
+    `deadline` (a time.monotonic() value) is shared by all stages of one compile,
+    so each stage only gets the time the earlier ones left; past it, the stage
+    raises subprocess.TimeoutExpired like a stage that ran too long.
+    """
+    timeout = None
+    if deadline is not None:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise subprocess.TimeoutExpired(command, 0)
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=cwd, capture_output=True, text=True, timeout=timeout)
+    report.timings.append((name, time.perf_counter() - start))
+    report.stage = name
+    report.returncode = result.returncode
+    report.stdout = result.stdout
+
+    result.diagnostics = parse_diagnostics(result.stderr)
+    for source in sources:
+        try:
+            with open(os.path.join(cwd or "", source), "r", encoding="utf-8", errors="replace") as f:
+                attach_source_lines(result.diagnostics, source, f.read())
+        except OSError:
+            pass
+    return result
+
+def diagnostic_flags(compiler, json_records=False):
+    """
+    Text output is parsed as well as JSON for the prompts and is what the user
+    wants to read, so JSON is only asked for by callers that never show stderr.
+    """
+    return [JSON_FORMAT_FLAG] if json_records and supports_json_diagnostics(compiler) else []
+
+def diagnose_source(source_name, cwd=None, compiler=COMPILER, timeout=None, json_records=False):
+    """
+    Harvests diagnostics for a single source file as cheaply as possible:
+    1. -fsyntax-only: parse and type-check only, enough for almost every error.
+    2. -c: code generation, only if stage 1 was clean.
+    3. link: only if stage 2 was clean, to surface "undefined reference" errors.
+    Stops at the first stage that fails. `timeout` covers all stages together.
+    With json_records the compile stages print JSON, so report.stderr is not
+    meant for people.
+    """
+    report = CompileReport()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    object_name = os.path.splitext(source_name)[0] + ".o"
+    flags = diagnostic_flags(compiler, json_records)
+
+    result = run_stage(report, "syntax", [compiler, "-fsyntax-only"] + flags + [source_name], cwd, deadline, [source_name])
+    if result.returncode != 0:
+        report.stderr = result.stderr
+        report.diagnostics = result.diagnostics
+        return report
+
+    # Warnings from stage 1 are printed again by -c, so stage 2's output supersedes it
+    result = run_stage(report, "compile", [compiler, "-c"] + flags + [source_name, "-o", object_name], cwd, deadline, [source_name])
+    report.stderr = result.stderr
+    report.diagnostics = result.diagnostics
+    if result.returncode != 0:
+        return report
+
+    result = run_stage(report, "link", [compiler, object_name, "-o", "a.out"], cwd, deadline)
+    report.stderr = "\n".join(part for part in (report.stderr, result.stderr) if part)
+    report.diagnostics += result.diagnostics
+    return report
+
+def split_compiler_args(args):
+    """
+    Splits a g++ command line into (source files, flags usable with -fsyntax-only).
+    Output, link and mode flags are left out of the second list, together with
+    their values. Returns None if the command has an option we can't classify.
+    """
+    sources = []
+    syntax_flags = []
+    args = iter(args)
+    for arg in args:
+        if arg in SYNTAX_FLAGS_WITH_VALUE:
+            value = next(args, None)
+            if value is None:
+                return None
+            syntax_flags += [arg, value]
+        elif arg in OUTPUT_FLAGS_WITH_VALUE:
+            if next(args, None) is None:
+                return None
+        elif arg in OUTPUT_ONLY_FLAGS or arg.startswith(LINK_FLAG_PREFIXES):
+            continue
+        elif arg.startswith(SYNTAX_FLAG_PREFIXES):
+            syntax_flags.append(arg)
+        elif arg.startswith("-"):
+            return None
+        elif arg.lower().endswith(SOURCE_EXTENSIONS):
+            sources.append(arg)
+        # Anything else (.o/.a/.so inputs) only matters to the linker
+    return sources, syntax_flags
+
+def diagnose_command(args, compiler=COMPILER, timeout=None):
+    """
+    Runs the user's own compiler command behind a -fsyntax-only pre-check.
+    If the sources don't even parse, those diagnostics are returned and the full
+    build (and link) is skipped; otherwise the real command runs unchanged. A
+    command with options split_compiler_args() can't classify runs directly.
+    `timeout` covers the pre-check and the build together.
+    """
+    report = CompileReport()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    split = split_compiler_args(args)
+    sources, syntax_flags = split if split is not None else ([], [])
+
+    if sources:
+        command = [compiler, "-fsyntax-only"] + syntax_flags + sources
+        result = run_stage(report, "syntax", command, None, deadline, sources)
+        if result.returncode != 0:
+            report.stderr = result.stderr
+            report.diagnostics = result.diagnostics
+            return report
+
+    result = run_stage(report, "build", [compiler] + list(args), None, deadline)
+    report.stderr = result.stderr
+    report.diagnostics = result.diagnostics
+    return report
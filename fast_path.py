@@ -0,0 +1,239 @@
+import re
+import json
+import time
+import argparse
+from generate_dataset import ERROR_JOBS
+from normalize import KNOWN_NAMES
+
+# --- Configuration ---
+CONFIDENCE_THRESHOLD = 0.8  # Rules below this never answer on their own
+
+# g++ quotes names with ‘’ in UTF-8 locales and '' in the C locale
+Q = "[‘'`]"
+E = "[’']"
+
+# Standard library names that "was not declared" must never be told to declare
+LIBRARY_NAMES = "|".join(sorted(KNOWN_NAMES | set("""
+    sqrt pow abs fabs exp log log10 floor ceil round sin cos tan atan atan2 hypot fmod rand srand time
+    strlen strcpy strncpy strcmp strncmp strcat strchr strstr memset memcpy memmove memcmp
+    atoi atol atof strtol strtod exit abort system getchar putchar fopen fclose fprintf fscanf
+    sprintf snprintf sscanf gets fgets fputs getline assert isdigit isalpha isspace toupper tolower
+    to_string stoi stod reverse accumulate fill count
+""".split()), key=len, reverse=True))
+
+JOB_TEXT = {
+    job["id"]: job["explanation"] + " " + job["suggested_fix"]["description"]
+    for job in ERROR_JOBS
+}
+
+# Ordered by priority: when several rules match one message, the earlier rule wins.
+# Each rule answers with either a curated ERROR_JOBS entry ("job", may use captured
+# groups in the id) or a template filled from the captured groups ("template").
+# The text follows the training target format: explanation, then the fix.
+RULES = [
+    {
+        "name": "missing_main",
+        "pattern": rf"undefined reference to {Q}(?:main|WinMain@16){E}",
+        "job": "gen-linker-no-main-01",
+        "confidence": 0.95,
+    },
+    {
+        "name": "missing_header_file",
+        "pattern": rf"fatal error: (?P<header>[^\s:]+): No such file or directory",
+        "template": "The compiler could not find the header '{header}' that you are trying to #include. "
+                    "Either the name is misspelled, it is not a standard header, or its directory is not on the include path. "
+                    "Check the spelling of '{header}' or add its directory with -I.",
+        "confidence": 0.9,
+    },
+    {
+        "name": "iostream_name",
+        "pattern": rf"{Q}(?:std::)?(?P<name>cout|cin|cerr|clog|endl){E} (?:was not declared in this scope|is not a member of {Q}std{E})",
+        "template": "The compiler does not recognize '{name}'. '{name}' is part of the C++ standard library: it is defined in the "
+                    "<iostream> header file and lives in the standard namespace ('std'). To use it, you must include <iostream> "
+                    "and either write 'std::{name}' or add 'using namespace std;'. "
+                    "Add '#include <iostream>' and use 'std::{name}'.",
+        "confidence": 0.95,
+    },
+    {
+        "name": "std_container_header",
+        "pattern": rf"{Q}(?:std::)?(?P<name>vector|string|map|set){E} (?:was not declared in this scope|is not a member of {Q}std{E}|does not name a type)",
+        "job": "gen-{name}-no-include-01",
+        "confidence": 0.9,
+    },
+    {
+        "name": "missing_brace",
+        "pattern": rf"expected {Q}\}}{E} at end of input",
+        "job": "gen-missing-brace-01",
+        "confidence": 0.9,
+    },
+    {
+        "name": "break_outside_loop",
+        "pattern": r"break statement not within loop or switch",
+        "job": "gen-break-no-loop-01",
+        "confidence": 0.95,
+    },
+    {
+        "name": "else_without_if",
+        "pattern": rf"{Q}else{E} without a previous {Q}if{E}",
+        "job": "gen-else-no-if-01",
+        "confidence": 0.95,
+    },
+    {
+        "name": "missing_semicolon",
+        "pattern": rf"expected {Q};{E} before {Q}(?P<next>[^’']+){E}|expected {Q},{E} or {Q};{E} before {Q}(?P<next2>[^’']+){E}",
+        "template": "In C++, statements must end with a semicolon (;). This symbol tells the compiler where one instruction ends "
+                    "and the next begins. The compiler reached '{next}' while the previous statement was still open, so a "
+                    "semicolon is missing just before it. Add a semicolon to the end of the previous statement.",
+        "confidence": 0.85,
+    },
+    {
+        "name": "read_only_assignment",
+        "pattern": rf"assignment of read-only (?:variable|location) {Q}(?P<name>[^’']+){E}",
+        "template": "'{name}' was declared 'const', so its value cannot be changed after it is initialized, but the code assigns "
+                    "to it. Remove the 'const' qualifier if '{name}' needs to change, or stop assigning to it.",
+        "confidence": 0.9,
+    },
+    {
+        "name": "abstract_instantiation",
+        "pattern": rf"cannot declare variable {Q}(?P<var>\w+){E} to be of abstract type {Q}(?P<type>[^’']+){E}",
+        "template": "'{type}' is an abstract class: it has at least one pure virtual function, so objects of it cannot be created, "
+                    "which is what declaring '{var}' tries to do. Create an object of a derived class that implements every pure "
+                    "virtual function instead.",
+        "confidence": 0.9,
+    },
+    {
+        "name": "undefined_reference",
+        "pattern": rf"undefined reference to {Q}(?P<name>[^’']+){E}",
+        "template": "This is a linker error. The code compiled, but the linker could not find a definition for '{name}': it was "
+                    "declared (so the compiler accepted the call) but never defined, or the file that defines it was not linked. "
+                    "Provide the missing definition of '{name}' or add the source file that defines it to the build.",
+        "confidence": 0.85,
+    },
+    {
+        "name": "invalid_conversion",
+        "pattern": rf"invalid conversion from {Q}(?P<source>[^’']+){E} to {Q}(?P<target>[^’']+){E}",
+        "template": "A value of type '{source}' is used where a '{target}' is required, and C++ will not convert between them "
+                    "implicitly. Ensure variable types match their assigned values: change the variable's type or convert the "
+                    "value explicitly.",
+        "confidence": 0.8,
+    },
+    {
+        "name": "control_reaches_end",
+        "pattern": r"control reaches end of non-void function",
+        "template": "The function is declared to return a value, but there is a path through it that reaches the closing brace "
+                    "without a 'return' statement. Add a 'return' statement with a value on every path through the function.",
+        "confidence": 0.85,
+    },
+    {
+        "name": "undeclared_identifier",
+        # Only for the user's own names: library functions need an #include, not a declaration,
+        # and g++'s "did you mean"/"did you forget to #include" hints are better left to the model
+        "pattern": rf"{Q}(?!(?:{LIBRARY_NAMES})\b)(?P<name>\w+){E} was not declared in this scope"
+                   rf"(?![\s\S]*did you (?:mean|forget))",
+        "template": "You are trying to use '{name}', which has not been declared. In C++, every variable or function must be "
+                    "declared before it is used, and names are case-sensitive. Declare '{name}' before using it (e.g. "
+                    "'int {name};'), or fix its spelling.",
+        "confidence": 0.8,
+    },
+]
+
+class FastPathIndex:
+    """
+    All rule signatures compiled into ONE alternation regex, so a diagnostic is
+    scanned once no matter how many rules there are. Group names are prefixed per
+    rule (r3__name) because Python forbids duplicates across alternatives.
+    """
+    def __init__(self, rules=RULES, threshold=CONFIDENCE_THRESHOLD):
+        self.rules = rules
+        self.threshold = threshold
+        alternatives = []
+        for index, rule in enumerate(rules):
+            pattern = re.sub(r"\(\?P<(\w+)>", rf"(?P<r{index}__\1>", rule["pattern"])
+            alternatives.append(f"(?P<r{index}>{pattern})")
+        self.regex = re.compile("|".join(alternatives))
+
+        self.lookups = 0
+        self.hits = 0
+        self.seconds = 0.0
+        self.rule_hits = {rule["name"]: 0 for rule in rules}
+
+    def match(self, error_message):
+        """
+        Returns (rule name, explanation) for the highest-priority confident rule
+        matching the message, or None to fall through to the model.
+        """
+        start = time.perf_counter()
+        best = None
+        for found in self.regex.finditer(error_message):
+            index = int(found.lastgroup[1:])
+            if best is None or index < best[0]:
+                best = (index, found)
+
+        answer = None
+        if best is not None:
+            index, found = best
+            rule = self.rules[index]
+            prefix = f"r{index}__"
+            groups = {
+                name[len(prefix):]: value
+                for name, value in found.groupdict().items()
+                if name.startswith(prefix) and value is not None
+            }
+            # Alternatives inside one rule may capture the same thing as name2
+            for name in list(groups):
+                if name.endswith("2") and name[:-1] not in groups:
+                    groups[name[:-1]] = groups.pop(name)
+
+            if rule["confidence"] >= self.threshold:
+                if "job" in rule:
+                    answer = JOB_TEXT.get(rule["job"].format(**groups))
+                else:
+                    answer = rule["template"].format(**groups)
+            if answer is not None:
+                self.rule_hits[rule["name"]] += 1
+                answer = (rule["name"], answer)
+
+        self.lookups += 1
+        self.hits += answer is not None
+        self.seconds += time.perf_counter() - start
+        return answer
+
+    def stats(self, model_seconds_per_item=None):
+        """Hit rate and lookup cost; with a model latency, also the generation time saved."""
+        stats = {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "avg_lookup_us": self.seconds / self.lookups * 1e6 if self.lookups else 0.0,
+            "rule_hits": {name: count for name, count in self.rule_hits.items() if count},
+        }
+        if model_seconds_per_item is not None:
+            stats["seconds_saved"] = self.hits * model_seconds_per_item - self.seconds
+        return stats
+
+FAST_PATH = FastPathIndex()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure rule-based fast-path coverage on a dataset.")
+    parser.add_argument("datasets", nargs="*", default=["error_dataset.json", "generated_dataset.json"],
+                        help="Dataset files to run the fast path over.")
+    parser.add_argument("--model_seconds", type=float, default=None,
+                        help="Measured seconds per model explanation, to estimate time saved.")
+    args = parser.parse_args()
+
+    index = FastPathIndex()
+    for path in args.datasets:
+        with open(path, "r", encoding="utf-8") as f:
+            for item in json.load(f):
+                index.match(item["error_message"])
+
+    stats = index.stats(args.model_seconds)
+    print(f"Lookups: {stats['lookups']} | hits: {stats['hits']} ({stats['hit_rate']:.1%}) | "
+          f"avg lookup: {stats['avg_lookup_us']:.1f} us")
+    for name, count in sorted(stats["rule_hits"].items(), key=lambda item: -item[1]):
+        print(f"  {name:<24} {count}")
+    if "seconds_saved" in stats:
+        print(f"Model time saved: {stats['seconds_saved']:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,21 @@ import subprocess
 import json
 import os
 import shlex
+import time
+import argparse
+import tempfile
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataset_io import write_records
 
 # --- Configuration ---
 # Change this to 'clang++' if you prefer
 COMPILER_TO_USE = 'g++' 
 OUTPUT_FILENAME = 'generated_dataset.json'
-TEMP_CPP_FILE = '_temp.cpp'
+TEMP_CPP_FILE = '_temp.cpp'  # Name the code gets inside each job's own temp directory
+MAX_WORKERS = os.cpu_count() or 2  # Compiles run at once
+BUILD_CACHE_FILE = 'build_cache.json'  # Captured stderr per (code, flags, compiler), reused across runs
 
 #this will make a dataset(still prototype) which has 25 entries, this can be used to train the model to a level where it atleast gives some output, not just padding tags(<padding>), also increased the no of epochs in the model to make sure the error is minimized further and global minima is reached by the model thus the predictions are better
 
@@ -373,50 +382,133 @@ ERROR_JOBS = [
     }
 ]
 
-def main():
-    """
-    Main function to generate the dataset.
+def compile_job(job):
     """
-    print(f"Starting dataset generation with '{COMPILER_TO_USE}'...")
-    
-    # Check if compiler is available
-    try:
-        subprocess.run([COMPILER_TO_USE, '-v'], capture_output=True, text=True, check=True)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print(f"Error: Compiler '{COMPILER_TO_USE}' not found.")
-        print("Please install it or change the 'COMPILER_TO_USE' variable in this script.")
-        return
+    Compiles one job in its own temporary directory and returns the cleaned
+    stderr ('' if the code compiled). Each job gets a private directory, so
+    any number can run at once without clobbering each other's _temp.cpp/_temp.o.
 
-    dataset = []
+    Jobs using the default flags are first checked with -fsyntax-only, which
+    skips code generation. When that already fails, g++ -c would have stopped
+    after the same front-end errors, so the output is identical. Only code that
+    passes the syntax check is re-run with -c, for diagnostics from later passes.
+    """
+    #    Use '-c' as default, but allow jobs to override flags
+    default_command_flags = [COMPILER_TO_USE, '-c']
+    command_flags = job.get("command_flags", default_command_flags)
 
-    for job in ERROR_JOBS:
-        # 1. Write the broken code to the temp file
-        try:
-            with open(TEMP_CPP_FILE, 'w') as f:
-                f.write(job['broken_code'])
-        except IOError as e:
-            print(f"Error writing temp file: {e}")
-            continue
+    with tempfile.TemporaryDirectory(prefix="gen_job_") as work_dir:
+        # 1. Write the broken code to this job's temp file
+        with open(os.path.join(work_dir, TEMP_CPP_FILE), 'w') as f:
+            f.write(job['broken_code'])
 
         # 2. Run the compiler and capture output
-        #    Use '-c' as default, but allow jobs to override flags
-        default_command_flags = [COMPILER_TO_USE, '-c']
-        
-        # Get custom command flags from the job, or use the default
-        command_flags = job.get("command_flags", default_command_flags)
-        
-        # Add the temp file to the command
-        command = command_flags + [TEMP_CPP_FILE]
-            
-        result = subprocess.run(command, capture_output=True, text=True)
-        
-        # 3. The error message is in stderr
-        error_message = result.stderr.strip()
-        
-        # 4. Clean up error message paths for consistency
-        #    Replaces the temp file's name with a generic 'source.cpp'
-        error_message = error_message.replace(TEMP_CPP_FILE, 'source.cpp')
+        result = None
+        if command_flags == default_command_flags:
+            result = subprocess.run([COMPILER_TO_USE, '-fsyntax-only', TEMP_CPP_FILE],
+                                    capture_output=True, text=True, cwd=work_dir)
+            if result.returncode == 0:
+                result = None
+        if result is None:
+            result = subprocess.run(command_flags + [TEMP_CPP_FILE], capture_output=True, text=True, cwd=work_dir)
+
+    # 3. The error message is in stderr
+    error_message = result.stderr.strip()
+
+    # 4. Clean up error message paths for consistency
+    #    Replaces the temp file's name with a generic 'source.cpp'
+    return error_message.replace(TEMP_CPP_FILE, 'source.cpp')
+
+def compiler_identity():
+    """Resolved compiler path plus its full --version text: a compiler upgrade changes every cache key."""
+    path = shutil.which(COMPILER_TO_USE) or COMPILER_TO_USE
+    version = subprocess.run([COMPILER_TO_USE, '--version'], capture_output=True, text=True).stdout
+    return f"{os.path.realpath(path)}\n{version.strip()}"
+
+class BuildCache:
+    """
+    Maps sha256(compiler identity, command flags, broken code) to the cleaned
+    stderr that job produced, stored as one JSON file. A cache written by a
+    different compiler is discarded on load, so the file never accumulates
+    entries that can't hit again.
+    """
+    def __init__(self, path, identity, load=True):
+        self.path = path
+        self.identity = identity
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        if load and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    saved = json.load(f)
+                if saved.get("compiler") == identity:
+                    self.entries = saved["entries"]
+            except (IOError, ValueError, KeyError) as e:
+                print(f"Warning: ignoring unreadable build cache {path}: {e}")
+
+    def key(self, job):
+        command_flags = job.get("command_flags", [COMPILER_TO_USE, '-c'])
+        payload = json.dumps([self.identity, command_flags, job['broken_code']])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, job):
+        error_message = self.entries.get(self.key(job))
+        if error_message is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return error_message
 
+    def put(self, job, error_message):
+        self.entries[self.key(job)] = error_message
+
+    def save(self):
+        """Atomic write (temp file + os.replace), so an interrupted run can't corrupt the cache."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({"compiler": self.identity, "entries": self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+def generate(jobs, max_workers=MAX_WORKERS, cache=None):
+    """
+    Compiles all jobs on a thread pool (each compile is its own g++ process, so
+    threads are enough to keep every core busy) and returns the data points in
+    the same order as `jobs`, whatever order the compiles finish in.
+    With a BuildCache, only jobs whose code, flags or compiler changed are compiled.
+    """
+    error_messages = [None] * len(jobs)
+    to_compile = []
+    for index, job in enumerate(jobs):
+        cached = cache.get(job) if cache is not None else None
+        if cached is None:
+            to_compile.append(index)
+        else:
+            error_messages[index] = cached
+    if cache is not None:
+        print(f"Build cache: {cache.hits} jobs unchanged, {len(to_compile)} to compile")
+
+    start = time.time()
+    last_report = 0.0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(compile_job, jobs[index]): index for index in to_compile}
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            error_messages[index] = future.result()
+            if cache is not None:
+                cache.put(jobs[index], error_messages[index])
+            now = time.time()
+            if now - last_report >= 1.0 or done == len(to_compile):
+                last_report = now
+                rate = done / max(now - start, 1e-9)
+                print(f"  [{done}/{len(to_compile)}] {rate:.1f} jobs/sec", flush=True)
+
+    if cache is not None and to_compile:
+        cache.save()
+
+    dataset = []
+    for job, error_message in zip(jobs, error_messages):
         if not error_message:
             print(f"Warning: Job '{job['id']}' produced no error. Skipping.")
             continue
@@ -431,24 +523,45 @@ def main():
             "suggested_fix": job['suggested_fix']
         }
         dataset.append(full_data_point)
+    return dataset
+
+def main():
+    """
+    Main function to generate the dataset.
+    """
+    parser = argparse.ArgumentParser(description="Compile ERROR_JOBS and save the resulting dataset.")
+    parser.add_argument("--output", type=str, default=OUTPUT_FILENAME, help="Where to write the dataset (.json, or .jsonl for JSON lines; .gz/.zst to compress)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Compiles to run in parallel")
+    parser.add_argument("--cache", type=str, default=BUILD_CACHE_FILE, help="Build cache file (reuses stderr of unchanged jobs)")
+    parser.add_argument("--no_cache", action="store_true", help="Compile every job and leave the cache untouched")
+    parser.add_argument("--rebuild", action="store_true", help="Compile every job and refresh the cache")
+    args = parser.parse_args()
 
-    # 6. Clean up the temp file
+    print(f"Starting dataset generation with '{COMPILER_TO_USE}' ({args.workers} workers)...")
+    
+    # Check if compiler is available
     try:
-        if os.path.exists(TEMP_CPP_FILE):
-            os.remove(TEMP_CPP_FILE)
-    except OSError as e:
-        print(f"Warning: Could not remove temp file: {e}")
+        subprocess.run([COMPILER_TO_USE, '-v'], capture_output=True, text=True, check=True)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        print(f"Error: Compiler '{COMPILER_TO_USE}' not found.")
+        print("Please install it or change the 'COMPILER_TO_USE' variable in this script.")
+        return
+
+    start = time.time()
+    cache = None
+    if not args.no_cache:
+        cache = BuildCache(args.cache, compiler_identity(), load=not args.rebuild)
+    dataset = generate(ERROR_JOBS, args.workers, cache)
 
-    # 7. Save the final dataset
+    # 6. Save the final dataset
     try:
-        with open(OUTPUT_FILENAME, 'w') as f:
-            json.dump(dataset, f, indent=2)
-    except IOError as e:
+        write_records(args.output, dataset)
+    except (IOError, ImportError) as e:
         print(f"Error writing dataset file: {e}")
         return
 
-    print(f"\nSuccessfully generated {len(dataset)} data points.")
-    print(f"Dataset saved to '{OUTPUT_FILENAME}'")
+    print(f"\nSuccessfully generated {len(dataset)} data points in {time.time() - start:.1f}s.")
+    print(f"Dataset saved to '{args.output}'")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
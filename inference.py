@@ -1,84 +1,481 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 import torch
-from transformers import T5ForConditionalGeneration, AutoTokenizer
+from transformers import T5ForConditionalGeneration, T5Config, AutoTokenizer, TextIteratorStreamer
+from normalize import normalize_error, templatize, fill_identifiers
+from fast_path import FAST_PATH
+from retrieval import RetrievalIndex
 
 MODEL_PATH = "./fine_tuned_t5_compiler_tutor"
+BACKENDS = ("pytorch", "int8", "onnx")  # see convert_model.py for producing int8/onnx models
+QUANTIZED_WEIGHTS = "quantized_int8.pt"
+PROMPT_PREFIX = "explain C++ error: "
+CACHE_SIZE = 1024          # Explanations kept in memory
+CACHE_DB_PATH = None       # Set to a file path to keep explanations across restarts
+CACHE_DB_MAX_ENTRIES = 50000
+USE_FAST_PATH = True       # Answer well-known error classes from fast_path.py rules without the model
+RETRIEVAL_THRESHOLD = 0.9  # Cosine similarity needed to reuse a dataset explanation; RetrievalIndex.answer also checks the names match
 
 MODEL = None
 TOKENIZER = None
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-def load_model(model_path="./fine_tuned_t5_compiler_tutor"):
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+RETRIEVAL = None           # RetrievalIndex, set by enable_retrieval()
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of every nn.Linear (weights int8, activations quantized on the fly)."""
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_backend_model(model_path, backend="pytorch"):
     """
-    Loads the model and tokenizer into the global variables.
-    This function is called ONLY ONCE when the app starts.
+    Loads the generator for one of BACKENDS:
+    - "pytorch": the fp32 model written by train.py.
+    - "int8": a dynamically quantized copy written by convert_model.py (CPU only).
+    - "onnx": an ONNX Runtime encoder/decoder-with-past export (needs `optimum[onnxruntime]`).
     """
-    global MODEL, TOKENIZER
-    
-    if MODEL is not None: # Don't reload if already loaded
-        return
-    print("Loading model from disk...")
-    TOKENIZER = AutoTokenizer.from_pretrained(model_path)
-    MODEL = T5ForConditionalGeneration.from_pretrained(model_path)
-    MODEL.to(DEVICE)
-    MODEL.eval()
-    print(f"Model loaded successfully to device: {DEVICE}")
+    if backend == "pytorch":
+        return T5ForConditionalGeneration.from_pretrained(model_path)
+
+    if backend == "int8":
+        # Rebuild the architecture, quantize it the same way, then load the int8 weights into it
+        model = quantize_int8(T5ForConditionalGeneration(T5Config.from_pretrained(model_path)))
+        state_dict = torch.load(f"{model_path}/{QUANTIZED_WEIGHTS}", map_location="cpu", weights_only=False)
+        model.load_state_dict(state_dict)
+        return model
+
+    if backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError:
+            raise ImportError("The onnx backend needs ONNX Runtime support: pip install optimum[onnxruntime]")
+        return ORTModelForSeq2SeqLM.from_pretrained(model_path, use_cache=True)
+
+    raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+def model_fingerprint(model_path):
+    """
+    Short hash of the name, size and mtime of every file in `model_path`, so a
+    model retrained or converted into the same directory gets new cache keys.
+    A hub model id (no local directory) fingerprints as "".
+    """
+    if not os.path.isdir(model_path):
+        return ""
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(model_path)):
+        path = os.path.join(model_path, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            digest.update(f"{name}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+class ModelSession:
+    """
+    Owns one loaded tokenizer/model pair so every request reuses the same weights.
+    Generation is guarded by a lock: the fast tokenizer and model.generate are
+    not safe to drive from several Gradio worker threads at the same time.
+    """
+    def __init__(self, model_path=MODEL_PATH, device=DEVICE, backend="pytorch"):
+        self.model_path = model_path
+        self.backend = backend
+        # Quantized and ONNX Runtime models run on the CPU
+        self.device = device if backend == "pytorch" else torch.device("cpu")
+        self.lock = threading.Lock()
+        self.generated = 0
+        self.generation_seconds = 0.0
+
+        start = time.perf_counter()
+        self.fingerprint = model_fingerprint(model_path)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = load_backend_model(model_path, backend)
+        if backend == "pytorch":
+            self.model.to(self.device)
+            self.model.eval()
+        elif backend == "int8":
+            self.model.eval()
+        self.load_seconds = time.perf_counter() - start
+
+    @property
+    def seconds_per_explanation(self):
+        """Average model time per generated explanation so far (None before the first one)."""
+        return self.generation_seconds / self.generated if self.generated else None
+
+    @property
+    def cache_namespace(self):
+        """
+        Identifies this model for the explanation cache: different backends may word
+        things differently, and the fingerprint keeps a retrained model from being
+        served the old one's explanations out of the on-disk tier.
+        """
+        return f"{self.model_path}|{self.backend}|{self.fingerprint}"
+
+    def explain(self, error_message, num_beams=4):
+        """
+        Runs beam search for a single error message and returns the decoded text.
+        """
+        return self.explain_batch([error_message], num_beams=num_beams)[0]
+
+    def explain_batch(self, error_messages, batch_size=8, num_beams=4):
+        """
+        Explains several error messages, returning the texts in the input order.
+        """
+        results = [None] * len(error_messages)
+        for indices, texts in self.iter_buckets(error_messages, batch_size, num_beams):
+            for index, text in zip(indices, texts):
+                results[index] = text
+        return results
 
-def explain_error(error_message):
+    def stream(self, error_message, num_beams=1, do_sample=False):
+        """
+        Yields the explanation in pieces while it is being generated.
+        Greedy decoding (or sampling) can emit tokens as soon as they're chosen; beam
+        search only knows its answer at the end, so num_beams > 1 yields it in one piece.
+        """
+        if num_beams > 1:
+            yield self.explain(error_message, num_beams=num_beams)
+            return
+
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        failure = []
+
+        def generate():
+            try:
+                with self.lock:
+                    stream_start = time.perf_counter()
+                    inputs = self.tokenizer(
+                        PROMPT_PREFIX + error_message,
+                        max_length = 512,
+                        truncation = True,
+                        return_tensors = "pt"
+                    )
+                    with torch.no_grad():
+                        self.model.generate(
+                            input_ids = inputs.input_ids.to(self.device),
+                            attention_mask = inputs.attention_mask.to(self.device),
+                            max_length = 512,
+                            do_sample = do_sample,
+                            streamer = streamer
+                        )
+                    self.generated += 1
+                    self.generation_seconds += time.perf_counter() - stream_start
+            except Exception as e:
+                failure.append(e)
+                streamer.end() # unblock the reader below
+
+        worker = threading.Thread(target=generate, name="explain-stream", daemon=True)
+        worker.start()
+        for piece in streamer:
+            if piece:
+                yield piece
+        worker.join()
+        if failure:
+            raise failure[0]
+
+    def iter_buckets(self, error_messages, batch_size=8, num_beams=4):
+        """
+        Sorts the inputs by token length, cuts them into buckets of `batch_size` and
+        runs one generate call per bucket, padding only to the longest input in it.
+        Yields (input indices, generated texts) as each bucket finishes.
+        """
+        if not error_messages:
+            return
+
+        input_texts = [PROMPT_PREFIX + message for message in error_messages]
+
+        #Tokenize without padding so the real lengths are known
+        with self.lock:
+            encoded = self.tokenizer(
+                input_texts,
+                max_length = 512,
+                truncation = True
+            )["input_ids"]
+
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+
+            #The lock is taken per bucket so interactive requests can interleave with bulk jobs
+            with self.lock:
+                bucket_start = time.perf_counter()
+                inputs = self.tokenizer(
+                    [input_texts[i] for i in bucket],
+                    max_length = 512,
+                    padding = "longest",
+                    truncation = True,
+                    return_tensors = "pt"
+                )
+
+                input_ids = inputs.input_ids.to(self.device)
+                attention_mask = inputs.attention_mask.to(self.device)
+
+                #inference mode to reduce the computation and not keep track of grads, etc
+                with torch.no_grad():
+                    output_sequences = self.model.generate(
+                        input_ids = input_ids,
+                        attention_mask = attention_mask,
+                        max_length = 512, #max 
+                        num_beams = num_beams,
+                        early_stopping = True #stop when ccomplete sentence is formed 
+                    )
+
+                generated_texts = self.tokenizer.batch_decode(
+                    output_sequences,
+                    skip_special_tokens = True
+                )
+                self.generated += len(bucket)
+                self.generation_seconds += time.perf_counter() - bucket_start
+
+            yield bucket, generated_texts
+
+class ExplanationCache:
     """
-    Takes the raw error message from the command line and returns the model's output
+    Two-tier cache of generated explanations keyed on the normalized error text.
+    The memory tier is an LRU of `max_entries`; the optional SQLite tier at `db_path`
+    survives restarts and is trimmed back to `max_db_entries` by least-recent use.
+    Values are explanation templates (see normalize.templatize).
     """
+    def __init__(self, max_entries=CACHE_SIZE, db_path=None, max_db_entries=CACHE_DB_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.max_db_entries = max_db_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS explanations "
+                "(key TEXT PRIMARY KEY, template TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.db.commit()
+
+    @staticmethod
+    def make_key(namespace, canonical_error):
+        return hashlib.sha256(f"{namespace}\n{canonical_error}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
 
-            
+            if self.db is not None:
+                row = self.db.execute("SELECT template FROM explanations WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.db.execute("UPDATE explanations SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self.db.commit()
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
 
-    #select the device to use
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"Using the device {device}")
+            self.misses += 1
+            return None
 
-    #load tokenizer and model
-    print(f"loading model from {MODEL_PATH}")
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
-    model = T5ForConditionalGeneration.from_pretrained(MODEL_PATH)
+    def put(self, key, template):
+        with self.lock:
+            self._remember(key, template)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO explanations (key, template, last_used) VALUES (?, ?, ?)",
+                    (key, template, time.time())
+                )
+                count = self.db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+                if count > self.max_db_entries:
+                    # Evict a tenth at a time so we don't pay for a DELETE on every insert
+                    excess = count - self.max_db_entries + self.max_db_entries // 10
+                    self.db.execute(
+                        "DELETE FROM explanations WHERE key IN "
+                        "(SELECT key FROM explanations ORDER BY last_used ASC LIMIT ?)",
+                        (excess,)
+                    )
+                self.db.commit()
 
-    #move model into current device
-    model.to(device)
+    def _remember(self, key, template):
+        self.memory[key] = template
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
 
-    model.eval() #set model to eval mode
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
 
-    prefix = "explain C++ error: "
-    input_text = prefix+error_message
+CACHE = ExplanationCache(CACHE_SIZE, CACHE_DB_PATH)
 
-    #Tokenize input
+def configure_cache(max_entries=CACHE_SIZE, db_path=None, max_db_entries=CACHE_DB_MAX_ENTRIES):
+    """Replaces the shared explanation cache, e.g. to enable the on-disk tier."""
+    global CACHE
+    CACHE = ExplanationCache(max_entries, db_path, max_db_entries)
+    return CACHE
 
-    inputs = tokenizer(
-        input_text,
-        max_length = 512,
-        padding = "max_length",
-        truncation = True,
-        return_tensors = "pt"
-    )
+def get_session(model_path=MODEL_PATH, backend="pytorch"):
+    """
+    Returns the shared ModelSession, loading it on first use.
+    The first caller decides which model path and backend are loaded; later calls reuse it.
+    """
+    global _SESSION, MODEL, TOKENIZER
+
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            print("Loading model from disk...")
+            _SESSION = ModelSession(model_path, backend=backend)
+            MODEL = _SESSION.model
+            TOKENIZER = _SESSION.tokenizer
+            print(f"Model loaded successfully to device: {_SESSION.device} [{backend}] ({_SESSION.load_seconds:.2f}s)")
+        return _SESSION
+
+def load_model(model_path=MODEL_PATH, backend="pytorch"):
+    """
+    Loads the model and tokenizer into the shared session (and the MODEL/TOKENIZER globals).
+    `backend` picks fp32 PyTorch, dynamic int8 or ONNX Runtime (see BACKENDS).
+    This function is called ONLY ONCE when the app starts; repeated calls are no-ops.
+    """
+    get_session(model_path, backend)
+
+def explain_error(error_message, num_beams=4):
+    """
+    Takes the raw error message from the command line and returns the model's output.
+    Uses the resident session, so only the first call pays for loading the weights.
+    """
+    return explain_errors([error_message], num_beams=num_beams)[0]
+
+def explain_errors(error_messages, batch_size=8, num_beams=4):
+    """
+    Batched version of explain_error for bulk jobs and multi-error compiles.
+    Inputs are length-bucketed and padded per batch, so short g++ diagnostics
+    don't pay for 512 tokens of padding. Results come back in input order.
+    """
+    error_messages = list(error_messages)
+    results = [None] * len(error_messages)
+    for index, text in iter_explanations(error_messages, batch_size, num_beams):
+        results[index] = text
+    return results
+
+def enable_retrieval(index_path, threshold=RETRIEVAL_THRESHOLD):
+    """
+    Answers errors that closely match a known dataset error from the retrieval index
+    (checked after the fast-path rules and before the cache and the model).
+    Returns the index, or None if `index_path` has not been built.
+    """
+    global RETRIEVAL, RETRIEVAL_THRESHOLD
+    if not os.path.exists(os.path.join(index_path, "meta.json")):
+        print(f"No retrieval index at {index_path}; build one with retrieval.py build")
+        return None
+    RETRIEVAL = RetrievalIndex(index_path)
+    RETRIEVAL_THRESHOLD = threshold
+    print(f"Retrieval index loaded: {len(RETRIEVAL)} known errors (threshold {threshold})")
+    return RETRIEVAL
+
+def known_answer(error_message):
+    """The fast-path or retrieval answer for an error, or None if it needs the model."""
+    if USE_FAST_PATH:
+        answer = FAST_PATH.match(error_message)
+        if answer is not None:
+            return answer[1]
+    if RETRIEVAL is not None:
+        return RETRIEVAL.answer(error_message, RETRIEVAL_THRESHOLD)
+    return None
+
+def fast_path_stats():
+    """Fast-path hit rate and lookup cost, plus model time saved once the model has generated something."""
+    return FAST_PATH.stats(_SESSION.seconds_per_explanation if _SESSION is not None else None)
+
+def stream_explanation(error_message, num_beams=1, do_sample=False):
+    """
+    Streaming version of explain_error: yields text pieces as the model produces them.
+    Defaults to greedy decoding so the first words arrive quickly; pass num_beams=4
+    to opt back into beam search (which then arrives in one piece).
+    A cached explanation is yielded whole.
+    """
+    answer = known_answer(error_message)
+    if answer is not None:
+        yield answer
+        return
+
+    if num_beams > 1:
+        yield explain_error(error_message, num_beams=num_beams)
+        return
+
+    session = get_session()
+    if do_sample: # sampled text isn't reproducible, so it bypasses the cache
+        yield from session.stream(error_message, num_beams, do_sample)
+        return
+
+    # Greedy streaming produces the same text as explain_errors(num_beams=1), so they share cache entries
+    canonical, identifiers = normalize_error(error_message)
+    key = ExplanationCache.make_key(f"{session.cache_namespace}|beams={num_beams}", canonical)
+
+    template = CACHE.get(key)
+    if template is not None:
+        yield fill_identifiers(template, identifiers)
+        return
+
+    pieces = []
+    for piece in session.stream(error_message, num_beams, do_sample):
+        pieces.append(piece)
+        yield piece
+    CACHE.put(key, templatize("".join(pieces), identifiers))
+
+def iter_explanations(error_messages, batch_size=8, num_beams=4):
+    """
+    Yields (input index, explanation) pairs as soon as each one is ready: cache hits
+    first, then every length bucket as its generate call finishes.
+
+    Errors matching a confident fast_path rule or a close retrieval match are answered
+    without the model, errors that normalize to something already explained are answered from CACHE,
+    and duplicates inside one call are generated only once.
+    """
+    error_messages = list(error_messages)
+    session = get_session()
+    namespace = f"{session.cache_namespace}|beams={num_beams}"
 
-    input_ids = inputs.input_ids.to(device)
-    attention_mask = inputs.attention_mask.to(device)
+    identifiers = [None] * len(error_messages)
+    pending = OrderedDict()  # cache key -> indices waiting on it
 
-    print("Generating explanation...")
+    for index, error_message in enumerate(error_messages):
+        answer = known_answer(error_message)
+        if answer is not None:
+            yield index, answer
+            continue
 
-    #inference mode to reduce the computation and not keep track of grads, etc
+        canonical, identifiers[index] = normalize_error(error_message)
+        key = ExplanationCache.make_key(namespace, canonical)
+        if key in pending:
+            pending[key].append(index)
+            continue
+        template = CACHE.get(key)
+        if template is not None:
+            yield index, fill_identifiers(template, identifiers[index])
+        else:
+            pending[key] = [index]
 
-    with torch.no_grad():
-        output_sequences = model.generate(
-            input_ids = input_ids,
-            attention_mask = attention_mask,
-            max_length = 512, #max 
-            num_beams = 4,
-            early_stopping = True #stop when ccomplete sentence is formed 
-        )
-    
-    generated_text = tokenizer.decode(
-        output_sequences[0],
-        skip_special_tokens = True
-    )
+    keys = list(pending)
+    to_generate = [error_messages[pending[key][0]] for key in keys]
 
-    return generated_text
+    for positions, texts in session.iter_buckets(to_generate, batch_size, num_beams):
+        for position, text in zip(positions, texts):
+            key = keys[position]
+            template = templatize(text, identifiers[pending[key][0]])
+            CACHE.put(key, template)
+            for index in pending[key]:
+                yield index, fill_identifiers(template, identifiers[index])
 
 def main():
     test_error = """ main.cpp: In function ‘int main()’: main.cpp:4:5: error: ‘cout’ was not declared in this scope 4 | cout << "Hello, World!"; | ^~~~ main.cpp:2:1: note: ‘std::cout’ is defined in header ‘<iostream>’; did you forget to ‘#include <iostream>’? or a ‘using namespace std;’? """
@@ -0,0 +1,79 @@
+import json
+import time
+import argparse
+import threading
+import inference
+from inference import explain_error, load_model, configure_cache, MODEL_PATH
+from scheduler import MicroBatchScheduler
+
+# --- Configuration ---
+DATASET_PATH = "error_dataset.json"
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def run_load(explain, samples, clients, requests_per_client):
+    """
+    Starts `clients` threads that each send `requests_per_client` requests back to back,
+    like students hitting the app at the same time. Returns (latencies, wall seconds).
+    """
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def client(client_id):
+        for i in range(requests_per_client):
+            error_message = samples[(client_id * requests_per_client + i) % len(samples)]
+            start = time.perf_counter()
+            explain(error_message)
+            elapsed = time.perf_counter() - start
+            with latencies_lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - start
+
+def report(name, latencies, wall_seconds):
+    print(f"{name:<9} | p50: {percentile(latencies, 50):.3f}s | p95: {percentile(latencies, 95):.3f}s | "
+          f"{len(latencies) / wall_seconds:.2f} req/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the one-at-a-time path against the micro-batching scheduler.")
+    parser.add_argument("--model", type=str, default=MODEL_PATH, help="Path to the fine-tuned model directory.")
+    parser.add_argument("--dataset", type=str, default=DATASET_PATH, help="Dataset to draw error messages from.")
+    parser.add_argument("--clients", type=int, default=8, help="Number of concurrent simulated users.")
+    parser.add_argument("--requests", type=int, default=4, help="Requests sent by each user.")
+    parser.add_argument("--max_batch_size", type=int, default=8, help="Scheduler max batch size.")
+    parser.add_argument("--max_wait_ms", type=float, default=10, help="Scheduler max wait in milliseconds.")
+    args = parser.parse_args()
+
+    with open(args.dataset, "r", encoding="utf-8") as f:
+        samples = [item["error_message"] for item in json.load(f)[:200]]
+
+    load_model(args.model)
+    # Measure generation only: with the cache on, the direct run would leave the scheduler run
+    # nothing but cache hits, and fast-path rules answer many samples without the model.
+    # Retrieval is never enabled here.
+    configure_cache(max_entries=0)
+    inference.USE_FAST_PATH = False
+    print(f"Load test: {args.clients} clients x {args.requests} requests (cache, fast path and retrieval off)")
+
+    latencies, wall = run_load(explain_error, samples, args.clients, args.requests)
+    report("direct", latencies, wall)
+
+    scheduler = MicroBatchScheduler(max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms).start()
+    latencies, wall = run_load(scheduler.explain, samples, args.clients, args.requests)
+    scheduler.stop()
+    report("scheduler", latencies, wall)
+    print(f"Scheduler ran {scheduler.batches_run} batches, "
+          f"avg batch size {scheduler.requests_run / max(scheduler.batches_run, 1):.1f}")
+
+if __name__ == "__main__":
+    main()
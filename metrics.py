@@ -0,0 +1,92 @@
+import math
+from collections import Counter
+
+# --- Text-generation metrics on token ids ---
+# Everything works on token id lists (the tokenizer's ids for the reference and
+# the generated ids as-is), so references tokenized once can be scored every
+# epoch without decoding or re-tokenizing anything. BLEU is therefore computed
+# over subword tokens, which is stricter than word-level BLEU.
+
+MAX_ORDER = 4
+
+def ngram_counts(ids, order):
+    return Counter(tuple(ids[i:i + order]) for i in range(len(ids) - order + 1))
+
+def lcs_length(a, b):
+    """
+    Length of the longest common subsequence of two id lists, using the
+    bit-parallel algorithm (Allison & Dix / Hyyrö): one Python big-int
+    operation per token of `b` instead of a len(a) x len(b) table.
+    """
+    if not a or not b:
+        return 0
+    masks = {}
+    for position, token in enumerate(a):
+        masks[token] = masks.get(token, 0) | (1 << position)
+    full = (1 << len(a)) - 1
+    row = full
+    for token in b:
+        matches = row & masks.get(token, 0)
+        row = ((row + matches) | (row - matches)) & full
+    return len(a) - bin(row).count("1")
+
+class GenerationMetrics:
+    """
+    Accumulates corpus BLEU-4, mean ROUGE-L F1 and exact match over
+    (generated, reference) pairs. All state is a flat list of sums (totals()),
+    so shards scored on different DDP ranks can be all-reduced and rebuilt
+    with from_totals() before compute().
+    """
+    def __init__(self):
+        self.matches = [0] * MAX_ORDER   # clipped n-gram matches per order
+        self.possible = [0] * MAX_ORDER  # generated n-grams per order
+        self.hyp_length = 0
+        self.ref_length = 0
+        self.rouge_l = 0.0
+        self.exact = 0
+        self.count = 0
+
+    def add(self, generated, reference):
+        generated, reference = list(generated), list(reference)
+        for order in range(1, MAX_ORDER + 1):
+            hyp_ngrams = ngram_counts(generated, order)
+            ref_ngrams = ngram_counts(reference, order)
+            self.matches[order - 1] += sum(min(count, ref_ngrams[gram]) for gram, count in hyp_ngrams.items())
+            self.possible[order - 1] += max(len(generated) - order + 1, 0)
+        self.hyp_length += len(generated)
+        self.ref_length += len(reference)
+
+        lcs = lcs_length(reference, generated)
+        if lcs:
+            precision, recall = lcs / len(generated), lcs / len(reference)
+            self.rouge_l += 2 * precision * recall / (precision + recall)
+        self.exact += generated == reference
+        self.count += 1
+
+    def totals(self):
+        return self.matches + self.possible + [self.hyp_length, self.ref_length, self.rouge_l, self.exact, self.count]
+
+    @classmethod
+    def from_totals(cls, totals):
+        metrics = cls()
+        totals = list(totals)
+        metrics.matches = totals[:MAX_ORDER]
+        metrics.possible = totals[MAX_ORDER:2 * MAX_ORDER]
+        metrics.hyp_length, metrics.ref_length, metrics.rouge_l, metrics.exact, metrics.count = totals[2 * MAX_ORDER:]
+        return metrics
+
+    def compute(self):
+        """Returns {"bleu", "rouge_l", "exact_match"}, each in [0, 1]."""
+        if not self.count:
+            return {"bleu": 0.0, "rouge_l": 0.0, "exact_match": 0.0}
+        if min(self.matches) == 0 or self.hyp_length == 0:
+            bleu = 0.0
+        else:
+            log_precision = sum(math.log(m / p) for m, p in zip(self.matches, self.possible)) / MAX_ORDER
+            brevity = min(0.0, 1 - self.ref_length / self.hyp_length)
+            bleu = math.exp(log_precision + brevity)
+        return {
+            "bleu": bleu,
+            "rouge_l": self.rouge_l / self.count,
+            "exact_match": self.exact / self.count,
+        }
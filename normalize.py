@@ -0,0 +1,85 @@
+import re
+
+# --- Canonicalization of g++ diagnostics ---
+# Two compiles of the same mistake rarely produce byte-identical stderr: the file
+# name, line/column numbers, temp object paths and the user's own identifiers all
+# change. These helpers rewrite those parts into fixed placeholders (the same idea
+# as generate_dataset.py rewriting '_temp.cpp' to 'source.cpp') so equal mistakes
+# map to equal text.
+
+SOURCE_PLACEHOLDER = "source.cpp"
+OBJECT_PLACEHOLDER = "object.o"
+IDENTIFIER_MARK = "⟦{}⟧"  # ⟦0⟧, ⟦1⟧ ... used in explanation templates
+
+# Names that carry meaning for the explanation and must never be canonicalized
+# ('cout' was not declared is a different mistake from 'total' was not declared).
+KNOWN_NAMES = frozenset("""
+    alignas alignof and asm auto bool break case catch char char8_t char16_t char32_t class
+    concept const consteval constexpr constinit const_cast continue co_await co_return
+    co_yield decltype default delete do double dynamic_cast else enum explicit export
+    extern false float for friend goto if inline int long mutable namespace new noexcept
+    not nullptr operator or private protected public register reinterpret_cast requires
+    return short signed sizeof static static_assert static_cast struct switch template
+    this thread_local throw true try typedef typeid typename union unsigned using virtual
+    void volatile wchar_t while override final main size_t
+    std cout cin cerr clog endl printf scanf puts malloc free string vector map set
+    unordered_map unordered_set list deque array pair tuple queue stack priority_queue
+    unique_ptr shared_ptr weak_ptr make_unique make_shared move forward swap max min sort
+    find begin end size iostream fstream sstream cstdio cstdlib cstring cmath algorithm
+    memory utility iterator optional variant thread mutex nullptr_t initializer_list
+    a I
+""".split())
+
+FILE_RE = re.compile(r"(?:[\w.~-]*[\\/])*[\w.-]+\.(?:cpp|cxx|cc|c|hpp|hxx|hh|h|o|obj)\b")
+HEX_RE = re.compile(r"0x[0-9a-fA-F]+")
+LOCATION_RE = re.compile(r":\d+(?::\d+)?(?=[:)])")
+GUTTER_RE = re.compile(r"^\s*\d+\s*\|", re.MULTILINE)
+QUOTED_IDENT_RE = re.compile(r"[‘'`]([A-Za-z_]\w*)[’']")
+WHITESPACE_RE = re.compile(r"[ \t]+")
+
+def _file_placeholder(match):
+    name = match.group(0)
+    if name.endswith((".o", ".obj")):
+        return OBJECT_PLACEHOLDER
+    return SOURCE_PLACEHOLDER
+
+def normalize_error(error_message):
+    """
+    Returns (canonical_text, identifiers) for a cleaned compiler error.
+    File names, temp objects, addresses and line/column numbers are replaced by
+    placeholders, and user identifiers quoted in the message become ⟦0⟧, ⟦1⟧ ...
+    in order of first appearance. `identifiers` lists the original names so an
+    explanation can be re-personalised with fill_identifiers().
+    """
+    text = FILE_RE.sub(_file_placeholder, error_message)
+    text = HEX_RE.sub("0xN", text)
+    text = LOCATION_RE.sub(lambda m: ":N:N" if m.group(0).count(":") == 2 else ":N", text)
+    text = GUTTER_RE.sub("N |", text)
+
+    identifiers = []
+    for match in QUOTED_IDENT_RE.finditer(text):
+        name = match.group(1)
+        if name not in KNOWN_NAMES and name not in identifiers:
+            identifiers.append(name)
+
+    for index, name in enumerate(identifiers):
+        text = re.sub(rf"\b{re.escape(name)}\b", IDENTIFIER_MARK.format(index), text)
+
+    lines = [WHITESPACE_RE.sub(" ", line).strip() for line in text.splitlines()]
+    return "\n".join(line for line in lines if line), identifiers
+
+def templatize(text, identifiers):
+    """
+    Replaces the quoted occurrences ('name', ‘name’, `name`, "name") of the given
+    identifiers in `text` with their ⟦n⟧ marks. Bare words are left alone: an
+    identifier called `result` or `value` is also an ordinary English word.
+    """
+    for index, name in enumerate(identifiers):
+        text = re.sub(rf"(?<=[‘'`\"]){re.escape(name)}(?=[’'`\"])", IDENTIFIER_MARK.format(index), text)
+    return text
+
+def fill_identifiers(template, identifiers):
+    """Inverse of templatize(): puts the caller's own identifiers back into a template."""
+    for index, name in enumerate(identifiers):
+        template = template.replace(IDENTIFIER_MARK.format(index), name)
+    return template
@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import time
+import zlib
+import hashlib
+import argparse
+import numpy as np
+from normalize import KNOWN_NAMES, normalize_error, templatize, fill_identifiers
+from dataset_io import DatasetReader
+
+# --- Configuration ---
+INDEX_PATH = "retrieval_index"   # Directory holding vectors.f32, records.jsonl and meta.json
+DIM = 1024                       # Hashed feature dimensions per error message
+DEFAULT_DATASETS = ["error_dataset.json", "generated_dataset.json", "scraped_dataset.json"]
+
+TOKEN_RE = re.compile(r"⟦\d+⟧|\w+|[^\w\s]")
+
+def vectorize(canonical_text, dim=DIM):
+    """
+    Hashed TF vector of a canonicalized error: word unigrams and bigrams hashed with
+    crc32 into `dim` buckets (with a hash-derived sign to cancel collisions),
+    log-scaled counts and L2 normalization, so a dot product is cosine similarity.
+    Needs no fitted vocabulary, which is what makes incremental adds cheap.
+    """
+    tokens = TOKEN_RE.findall(canonical_text.lower())
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in features:
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector.astype(np.float32)
+
+def known_names(canonical_text):
+    """
+    The KNOWN_NAMES words of a canonicalized error ('vector', 'cout', 'const', ...).
+    Hashed vectors barely move when one of them changes, yet a missing <deque> and
+    a missing <vector> need different answers.
+    """
+    return {token for token in TOKEN_RE.findall(canonical_text) if token in KNOWN_NAMES}
+
+class RetrievalIndex:
+    """
+    Nearest-neighbour index over known compiler errors.
+
+    On disk it is three files in one directory:
+    - vectors.f32: raw float32 rows of DIM values, appended to and memory-mapped,
+      so opening the index costs nothing and adds never rewrite old rows;
+    - records.jsonl: one line per row with the record's id, error_type,
+      explanation, suggested_fix and the identifiers its message used;
+    - meta.json: dimension and row count, replaced atomically after each add.
+    Records whose canonical message is already indexed are skipped.
+    """
+    def __init__(self, path=INDEX_PATH, dim=DIM):
+        self.path = path
+        self.dim = dim
+        self.records = []
+        self.keys = set()
+        self.records_bytes = 0  # length of the records.jsonl lines that meta.json counts
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            with open(os.path.join(path, "records.jsonl"), "rb") as f:
+                for line in f:
+                    if len(self.records) == meta["count"]:
+                        break # a crash after appending but before meta.json was written
+                    self.records.append(json.loads(line))
+                    self.records_bytes += len(line)
+            self.keys = {record["key"] for record in self.records}
+            self._map_vectors()
+
+    def _map_vectors(self):
+        if self.records:
+            self.vectors = np.memmap(
+                os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode="r",
+                shape=(len(self.records), self.dim)
+            )
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, records):
+        """Appends new records to the index; returns how many were actually added."""
+        new_rows = []
+        new_records = []
+        for record in records:
+            canonical, identifiers = normalize_error(record["error_message"])
+            key = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+            if key in self.keys:
+                continue
+            self.keys.add(key)
+            new_rows.append(vectorize(canonical, self.dim))
+            new_records.append({
+                "key": key,
+                "id": record.get("id"),
+                "error_type": record.get("error_type"),
+                "error_message": record["error_message"],
+                "explanation": record.get("explanation", ""),
+                "suggested_fix": record.get("suggested_fix", {}),
+                "identifiers": identifiers,
+            })
+
+        if not new_rows:
+            return 0
+
+        # Drop any rows and records a previous crash left past the recorded count before
+        # appending, so row i of vectors.f32 and line i of records.jsonl stay the same entry
+        vectors_path = os.path.join(self.path, "vectors.f32")
+        records_path = os.path.join(self.path, "records.jsonl")
+        row_bytes = self.dim * 4
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32) # release the memmap before touching the file
+        if os.path.exists(vectors_path):
+            os.truncate(vectors_path, len(self.records) * row_bytes)
+        if os.path.exists(records_path):
+            os.truncate(records_path, self.records_bytes)
+        with open(vectors_path, "ab") as f:
+            f.write(np.stack(new_rows).astype(np.float32).tobytes())
+        with open(records_path, "ab") as f:
+            for record in new_records:
+                line = (json.dumps(record) + "\n").encode("utf-8")
+                f.write(line)
+                self.records_bytes += len(line)
+
+        self.records.extend(new_records)
+        meta_tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": len(self.records)}, f)
+        os.replace(meta_tmp, os.path.join(self.path, "meta.json"))
+
+        self._map_vectors()
+        return len(new_records)
+
+    def search(self, error_message, k=5):
+        """Returns up to k (similarity, record) pairs, most similar first."""
+        if not self.records:
+            return []
+        canonical, _ = normalize_error(error_message)
+        scores = self.vectors @ vectorize(canonical, self.dim)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.records[i]) for i in top]
+
+    def answer(self, error_message, threshold):
+        """
+        The stored explanation and fix of the nearest known error, with that error's
+        identifiers swapped for this one's. Only given when the two are at least
+        `threshold` similar AND are the same canonical error or mention the same
+        KNOWN_NAMES words; similarity alone also pairs different mistakes. Returns
+        None otherwise (hints() still lists the near matches).
+        """
+        results = self.search(error_message, k=1)
+        if not results or results[0][0] < threshold:
+            return None
+        record = results[0][1]
+        canonical, identifiers = normalize_error(error_message)
+        if hashlib.sha256(canonical.encode("utf-8")).hexdigest() != record["key"]:
+            if known_names(canonical) != known_names(normalize_error(record["error_message"])[0]):
+                return None
+        text = record["explanation"] + " " + record["suggested_fix"].get("description", "")
+        if len(identifiers) == len(record["identifiers"]):
+            text = fill_identifiers(templatize(text, record["identifiers"]), identifiers)
+        return text.strip()
+
+    def hints(self, error_message, k=3, threshold=0.0):
+        """
+        Up to k (similarity, record) pairs at least `threshold` similar: related known
+        errors to show next to a generated explanation, never used as the answer.
+        """
+        return [(score, record) for score, record in self.search(error_message, k) if score >= threshold]
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, extend or query the error retrieval index.")
+    parser.add_argument("command", choices=["build", "add", "query"], help="build/add datasets, or query an error message.")
+    parser.add_argument("inputs", nargs="*", help="Dataset files (build/add) or the error message (query).")
+    parser.add_argument("--index", type=str, default=INDEX_PATH, help="Index directory.")
+    parser.add_argument("--k", type=int, default=5, help="Results to show for query.")
+    args = parser.parse_args()
+
+    if args.command == "build" and os.path.exists(os.path.join(args.index, "meta.json")):
+        for name in ("vectors.f32", "records.jsonl", "meta.json"):
+            os.remove(os.path.join(args.index, name))
+
+    index = RetrievalIndex(args.index)
+
+    if args.command in ("build", "add"):
+        for path in args.inputs or DEFAULT_DATASETS:
+            added = index.add(DatasetReader(path))
+            print(f"{path}: added {added} records")
+        print(f"Index at {args.index} holds {len(index)} distinct errors")
+        return
+
+    query = " ".join(args.inputs)
+    start = time.perf_counter()
+    results = index.search(query, args.k)
+    elapsed = time.perf_counter() - start
+    for score, record in results:
+        print(f"{score:.3f} | {record['id']} | {record['error_type']} | {record['explanation'][:80]}")
+    print(f"Searched {len(index)} errors in {elapsed * 1000:.3f} ms")
+
+if __name__ == "__main__":
+    main()
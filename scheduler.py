@@ -0,0 +1,94 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from inference import explain_errors
+
+# --- Configuration ---
+MAX_BATCH_SIZE = 8   # Most requests coalesced into one generate call
+MAX_WAIT_MS = 10     # How long the first request in a batch waits for company
+
+class MicroBatchScheduler:
+    """
+    Queues explanation requests from many callers and runs them as one batched
+    generate call. The first request to arrive opens a window of `max_wait_ms`;
+    anything queued before the window closes (up to `max_batch_size`) rides along.
+    Each caller gets a Future that resolves to its own explanation.
+    """
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, explain_batch=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.explain_batch = explain_batch or (lambda messages: explain_errors(messages, batch_size=max_batch_size))
+
+        self.requests = queue.Queue()
+        self.batches_run = 0
+        self.requests_run = 0
+        self._thread = None
+
+    def start(self):
+        """Starts the background worker thread (idempotent)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="explain-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Lets the worker finish the queued requests and exit."""
+        if self._thread is not None:
+            self.requests.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, error_message):
+        """Queues one error message and returns a Future for its explanation."""
+        future = Future()
+        self.requests.put((error_message, future))
+        return future
+
+    def explain(self, error_message, timeout=None):
+        """Blocking helper with the same shape as inference.explain_error."""
+        return self.submit(error_message).result(timeout)
+
+    def _run(self):
+        while True:
+            first = self.requests.get()
+            if first is None:
+                return
+
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stopping = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._dispatch(batch)
+            if stopping:
+                return
+
+    def _dispatch(self, batch):
+        # Drop requests whose callers already gave up
+        batch = [(message, future) for message, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            results = self.explain_batch([message for message, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.requests_run += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
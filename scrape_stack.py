@@ -1,12 +1,28 @@
 import os
 import sys
 import re
+import gzip
 import json
+import hashlib
 import time
+import queue
 import argparse
-import urllib.request
+import threading
+import http.client
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from html.parser import HTMLParser
+from dataset_io import iter_file, write_records
+
+# --- Configuration ---
+API_BASE = "https://api.stackexchange.com/2.3"
+QUESTION_TAGS = "c++;compiler-errors"
+PAGE_SIZE = 100            # API maximum for pagesize and for ids per /answers/{ids} call
+REQUESTS_PER_SECOND = 5    # Token-bucket refill rate (the API bans clients above 30/s)
+BURST = 5                  # Token-bucket capacity
+CONNECTIONS = 2            # Keep-alive connections (answers for one page load while the next page is fetched)
+MAX_RETRIES = 5
+CACHE_DIR = "so_cache"     # Raw API responses, so re-parsing never re-downloads
 
 # --- HTML Parser for SO Post Bodies ---
 class SOBodyParser(HTMLParser):
@@ -45,186 +61,508 @@ class SOBodyParser(HTMLParser):
         return " ".join(full_text.split())
 
 # --- Heuristic Categorization helpers ---
+# Every keyword is compiled once at import time and counted with findall, which
+# finds a pattern's leading literal with a fast C scan. (One alternation of all
+# keywords loses that: Python's re then tries every alternative at every
+# position, and it measured slower than the old uncompiled loops.) Error
+# keywords are lowercase and matched against the lowercased block, which is
+# IGNORECASE without its slower matching. The decisions are derived from the
+# counts exactly as the old per-keyword checks made them.
+CPP_KEYWORDS = [
+    ("include", r'#include'), ("std", r'std::'), ("cout", r'cout\s*<<'), ("cin", r'cin\s*>>'),
+    ("endl", r'endl'), ("int_main", r'int\s+main'), ("using_namespace", r'using\s+namespace'),
+    ("vector", r'vector\s*<'), ("struct", r'struct\s+\w+'), ("class", r'class\s+\w+'),
+    ("return_int", r'return\s+\d+;'), ("printf", r'printf\(')
+]
+ERROR_KEYWORDS = [  # lowercase: matched against code_str.lower()
+    ("error", r'error:'), ("warning", r'warning:'), ("note", r'note:'), ("ld_returned", r'ld returned\s+\d+'),
+    ("undefined_reference", r'undefined reference to'), ("collect2", r'collect2:'), ("fatal_error", r'fatal error:'),
+    ("cpp_location", r'\.cpp:\d+:\d+:'), ("caret", r'\^~~~')
+]
+CPP_KEYWORD_RES = [(name, re.compile(pattern)) for name, pattern in CPP_KEYWORDS]
+ERROR_KEYWORD_RES = [(name, re.compile(pattern)) for name, pattern in ERROR_KEYWORDS]
+
+def _count_keywords(keyword_res, text):
+    """Occurrences of each keyword found in text, by name (absent keywords are left out)."""
+    counts = {}
+    for name, regex in keyword_res:
+        count = len(regex.findall(text))
+        if count:
+            counts[name] = count
+    return counts
+
+class BlockFeatures:
+    """
+    What classify_block() found in a code block: keyword occurrence counts per
+    category (by keyword name, only those present), structure character counts,
+    and the two decisions derived from them.
+    """
+    def __init__(self, code_str):
+        self.cpp_counts = _count_keywords(CPP_KEYWORD_RES, code_str)
+        self.error_counts = _count_keywords(ERROR_KEYWORD_RES, code_str.lower())
+        self.structure_counts = {"semicolon": code_str.count(';'), "open_brace": code_str.count('{'),
+                                 "close_brace": code_str.count('}')}
+        # Semicolons and brackets check
+        self.structure_score = int(self.structure_counts["semicolon"] > 0)
+        self.structure_score += int(self.structure_counts["open_brace"] > 0 and self.structure_counts["close_brace"] > 0)
+        self.is_cpp = bool(self.cpp_counts) or self.structure_score >= 2
+        self.is_error = bool(self.error_counts)
+
+def classify_block(code_str):
+    """Scores a code block for both categories; returns its BlockFeatures."""
+    return BlockFeatures(code_str)
+
 def is_likely_cpp_code(code_str):
     """Checks if a code block is likely C++ source code."""
-    cpp_keywords = [
-        r'#include', r'std::', r'cout\s*<<', r'cin\s*>>', r'endl', r'int\s+main', 
-        r'using\s+namespace', r'vector\s*<', r'struct\s+\w+', r'class\s+\w+',
-        r'return\s+\d+;', r'printf\('
-    ]
-    # Semicolons and brackets check
-    structure_score = 0
-    if ';' in code_str:
-        structure_score += 1
-    if '{' in code_str and '}' in code_str:
-        structure_score += 1
-    
-    keyword_matches = sum(1 for kw in cpp_keywords if re.search(kw, code_str))
-    
-    return keyword_matches >= 1 or structure_score >= 2
+    return classify_block(code_str).is_cpp
 
 def is_likely_compiler_error(code_str):
     """Checks if a code block contains compiler error outputs."""
-    error_keywords = [
-        r'error:', r'warning:', r'note:', r'ld returned\s+\d+', 
-        r'undefined reference to', r'collect2:', r'fatal error:',
-        r'\.cpp:\d+:\d+:', r'\^~~~'
-    ]
-    return any(re.search(kw, code_str, re.IGNORECASE) for kw in error_keywords)
-
-# --- Stack Exchange API Query Helpers ---
-def fetch_api_json(url):
-    """Fetches JSON content from the Stack Exchange API, handles gzip decoding if needed."""
-    headers = {
-        "User-Agent": "C++AITutorScraper/1.0"
-    }
-    req = urllib.request.Request(url, headers=headers)
-    try:
-        with urllib.request.urlopen(req) as response:
-            encoding = response.info().get('Content-Encoding')
-            data = response.read()
-            if encoding == 'gzip':
-                import gzip
-                data = gzip.decompress(data)
-            return json.loads(data.decode('utf-8'))
-    except Exception as e:
-        print(f"Error requesting API: {e}", file=sys.stderr)
-        return None
+    return classify_block(code_str).is_error
 
-# --- Main scraping pipeline ---
-def main():
-    parser = argparse.ArgumentParser(description="Scrape Stack Overflow for C++ compiler errors and fixes.")
-    parser.add_argument("--limit", type=int, default=10, help="Number of questions to pull (max 100 per page).")
-    parser.add_argument("--output", type=str, default="scraped_dataset.json", help="Path to output JSON dataset.")
-    parser.add_argument("--api-key", type=str, default=None, help="StackApps API Key to increase quota limit.")
-    args = parser.parse_args()
+# --- Stack Exchange API client ---
+class QuotaExhausted(Exception):
+    """The API's daily request quota is used up; the crawl has to be resumed later."""
+
+class CacheMiss(Exception):
+    """An offline (re-parse) run needed a response that was never downloaded."""
+
+class ResponseCache:
+    """
+    Raw API responses on disk, one gzip file per request URL (sha256 of the URL
+    without the API key, fanned out into 256 sub-directories). Only successful
+    responses are stored, and writes go through a temp file + os.replace.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+
+    def _path(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".json.gz")
+
+    def get(self, url):
+        path = self._path(url)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            payload = json.loads(gzip.decompress(f.read()).decode("utf-8"))
+        self.hits += 1
+        return payload
+
+    def put(self, url, data):
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(gzip.compress(data))
+        os.replace(tmp_path, path)
+
+    def get_answer(self, answer_id):
+        """One answer cached on its own; {} if the API returned nothing for the id, None if never fetched."""
+        return self.get(f"answer:{answer_id}")
+
+    def put_answer(self, answer_id, answer):
+        self.put(f"answer:{answer_id}", json.dumps(answer).encode("utf-8"))
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `capacity`."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
-    print(f"Initializing Stack Overflow API scraper (Limit: {args.limit})...")
+class StackExchangeClient:
+    """
+    Small Stack Exchange API client over pooled keep-alive http.client
+    connections (one TLS handshake per connection instead of per request).
+
+    Every request goes through the token bucket. A `backoff` field in a response
+    blocks all further requests for that many seconds (the API asks for this
+    and bans clients that ignore it). Throttle errors, 5xx responses and dropped
+    connections are retried with exponential backoff. QuotaExhausted is raised
+    once quota_remaining reaches 0.
+
+    With a ResponseCache, cached URLs are answered from disk without touching
+    the network or the quota; `offline=True` raises CacheMiss instead of downloading.
+    """
+    def __init__(self, api_base=API_BASE, api_key=None, rate=REQUESTS_PER_SECOND, burst=BURST,
+                 connections=CONNECTIONS, max_retries=MAX_RETRIES, cache=None, offline=False):
+        parsed = urllib.parse.urlsplit(api_base)
+        self.scheme = parsed.scheme
+        self.host = parsed.netloc
+        self.base_path = parsed.path.rstrip("/")
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate, burst)
+        self.pool = queue.Queue()
+        for _ in range(connections):
+            self.pool.put(None) # connections are opened lazily
+        self.backoff_until = 0.0
+        self.lock = threading.Lock()
+        self.quota_remaining = None
+        self.requests = 0
+        self.cache = cache
+        self.offline = offline
+
+    def _connect(self):
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, timeout=30)
+        return http.client.HTTPConnection(self.host, timeout=30)
+
+    def _wait_for_backoff(self):
+        with self.lock:
+            wait = self.backoff_until - time.monotonic()
+        if wait > 0:
+            print(f"  (API backoff: waiting {wait:.1f}s)")
+            time.sleep(wait)
+
+    def _set_backoff(self, seconds):
+        with self.lock:
+            self.backoff_until = max(self.backoff_until, time.monotonic() + seconds)
+
+    def get(self, path, params):
+        """GETs {api_base}{path} with `params` (plus site/key) and returns the decoded JSON."""
+        params = dict(params, site="stackoverflow")
+        cache_url = f"{self.base_path}{path}?{urllib.parse.urlencode(params)}"
+        if self.api_key:
+            params["key"] = self.api_key
+        url = f"{self.base_path}{path}?{urllib.parse.urlencode(params)}"
+
+        if self.cache is not None:
+            payload = self.cache.get(cache_url)
+            if payload is not None:
+                return payload
+        if self.offline:
+            raise CacheMiss(f"{path[:60]} is not in the response cache")
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_backoff()
+            self.bucket.acquire()
+            connection = self.pool.get()
+            try:
+                if connection is None:
+                    connection = self._connect()
+                connection.request("GET", url, headers={
+                    "User-Agent": "C++AITutorScraper/1.0",
+                    "Accept-Encoding": "gzip",
+                })
+                response = connection.getresponse()
+                data = response.read()
+                status = response.status
+                if response.getheader("Content-Encoding") == "gzip":
+                    data = gzip.decompress(data)
+                payload = json.loads(data.decode("utf-8")) if data else {}
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                # Dropped keep-alive connection, timeout or garbled body: reconnect and retry
+                connection.close()
+                connection = None
+                print(f"Error requesting API ({e}); retrying", file=sys.stderr)
+                time.sleep(min(2 ** attempt, 60))
+                continue
+            finally:
+                self.pool.put(connection)
+
+            with self.lock:
+                self.requests += 1
+                if "quota_remaining" in payload:
+                    self.quota_remaining = payload["quota_remaining"]
+            if "backoff" in payload:
+                self._set_backoff(payload["backoff"])
+
+            error_id = payload.get("error_id")
+            if status == 200 and error_id is None:
+                if self.cache is not None:
+                    self.cache.put(cache_url, data)
+                if self.quota_remaining == 0:
+                    raise QuotaExhausted("daily quota used up (pass --api-key for a larger quota)")
+                return payload
+            if error_id == 502: # throttle_violation
+                self._set_backoff(payload.get("backoff", 2 ** attempt * 5))
+                continue
+            if error_id == 406 or (status == 400 and "quota" in str(payload.get("error_message", "")).lower()):
+                raise QuotaExhausted(payload.get("error_message", "quota exceeded"))
+            if status >= 500 or error_id in (500, 503):
+                time.sleep(min(2 ** attempt, 60))
+                continue
+            raise RuntimeError(f"API error {status} {error_id}: {payload.get('error_message', '')}")
+
+        raise RuntimeError(f"Giving up on {path[:60]} after {self.max_retries + 1} attempts")
+
+    def close(self):
+        while not self.pool.empty():
+            connection = self.pool.get()
+            if connection is not None:
+                connection.close()
+
+# --- Record extraction ---
+def build_record(question, answer):
+    """
+    Turns a question and its accepted answer into a dataset record, or returns
+    (None, reason) when the question has no recognizable compiler error.
+    """
+    # Parse question body
+    q_parser = SOBodyParser()
+    q_parser.feed(question["body"])
     
-    # Target tag search: c++ AND compiler-errors
-    api_url = "https://api.stackexchange.com/2.3/questions?"
-    params = {
-        "pagesize": min(args.limit, 100),
-        "order": "desc",
-        "sort": "votes",
-        "tagged": "c++;compiler-errors",
-        "site": "stackoverflow",
-        "filter": "withbody"  # retrieve question text body
-    }
-    if args.api_key:
-        params["key"] = args.api_key
-        
-    url = api_url + urllib.parse.urlencode(params)
-    print(f"Fetching questions from: {url}")
+    # Find the question code blocks holding compiler output (one classifier call per block)
+    error_blocks = [cb for cb in q_parser.code_blocks if classify_block(cb).is_error]
     
-    questions_data = fetch_api_json(url)
-    if not questions_data or "items" not in questions_data:
-        print("Failed to fetch questions from Stack Exchange API.")
-        return
+    # Heuristic checks
+    error_message = ""
+    
+    if error_blocks:
+        error_message = error_blocks[0]
+    elif q_parser.code_blocks:
+        # Fallback to the first non-code block if no explicit error layout found
+        error_message = q_parser.code_blocks[0]
         
-    items = questions_data["items"]
-    print(f"Found {len(items)} questions. Processing and downloading accepted solutions...")
+    # Clean up empty components
+    if not error_message:
+        return None, "Could not isolate compiler error output inside question"
 
-    dataset = []
+    # Parse answer body
+    ans_parser = SOBodyParser()
+    ans_parser.feed(answer["body"])
+    
+    explanation = ans_parser.get_clean_text()
     
-    for idx, item in enumerate(items):
+    # Extract corrected code block
+    suggested_code = ""
+    ans_cpp_blocks = [cb for cb in ans_parser.code_blocks if is_likely_cpp_code(cb)]
+    if ans_cpp_blocks:
+        suggested_code = ans_cpp_blocks[0]
+    elif ans_parser.code_blocks:
+        suggested_code = ans_parser.code_blocks[0]
+        
+    # Structure payload
+    data_point = {
+        "id": f"so-question-{question['question_id']}",
+        "compiler": "gcc",  # standard compiler target
+        "error_type": "Compiler Error",
+        "error_message": error_message,
+        "explanation": explanation[:300] + "..." if len(explanation) > 300 else explanation,
+        "suggested_fix": {
+            "type": "code_modification" if suggested_code else "documentation_clarification",
+            "description": "Adjust the implementation based on the Stack Overflow solution.",
+            "code": suggested_code if suggested_code else "Check description for details."
+        }
+    }
+    return data_point, None
+
+# --- Crawl state ---
+def load_checkpoint(path):
+    """Returns the saved crawl state, or a fresh one."""
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"next_page": 1, "questions_seen": 0, "has_more": True, "records": 0, "jsonl_offset": 0}
+
+def save_checkpoint(path, state):
+    """Atomic write (temp file + os.replace): an interrupted crawl always finds a complete checkpoint."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+# --- Main scraping pipeline ---
+def fetch_answers(client, answer_ids):
+    """
+    Accepted answers by id. Every answer is also cached on its own, because the
+    semicolon-joined request for a page depends on where --limit cut it; this
+    way a re-parse finds each downloaded answer whatever its --limit. Uncached
+    ids are fetched PAGE_SIZE per call. Returns (answers, ids that are not in
+    the cache), the latter only ever non-empty when offline.
+    """
+    cache = client.cache
+    answers = {}
+    uncached = []
+    for answer_id in answer_ids:
+        cached = cache.get_answer(answer_id) if cache is not None else None
+        if cached is None:
+            uncached.append(answer_id)
+        elif cached:
+            answers[answer_id] = cached
+
+    missing = []
+    for start in range(0, len(uncached), PAGE_SIZE):
+        chunk = uncached[start:start + PAGE_SIZE]
+        ids = ";".join(str(answer_id) for answer_id in chunk)
+        try:
+            payload = client.get(f"/answers/{ids}", {"pagesize": PAGE_SIZE, "filter": "withbody"})
+        except CacheMiss:
+            missing += chunk
+            continue
+        found = {answer["answer_id"]: answer for answer in payload.get("items", [])}
+        answers.update(found)
+        if cache is not None:
+            for answer_id in chunk:
+                cache.put_answer(answer_id, found.get(answer_id, {}))
+    return answers, missing
+
+def process_page(state, questions, answers, out):
+    """Writes the records for one page of questions to `out` (JSONL) as they are built."""
+    for item in questions:
+        state["questions_seen"] += 1
         q_id = item["question_id"]
-        title = item["title"]
-        body = item["body"]
+        print(f"[{state['questions_seen']}] Question ID {q_id}: {item['title']}")
+
         accepted_ans_id = item.get("accepted_answer_id")
-        
-        print(f"[{idx+1}/{len(items)}] Question ID {q_id}: {title}")
-        
         if not accepted_ans_id:
             print("  -> No accepted answer. Skipping.")
             continue
-            
-        # Parse question body
-        q_parser = SOBodyParser()
-        q_parser.feed(body)
-        
-        # Categorize question code blocks
-        cpp_code_blocks = [cb for cb in q_parser.code_blocks if is_likely_cpp_code(cb)]
-        error_blocks = [cb for cb in q_parser.code_blocks if is_likely_compiler_error(cb)]
-        
-        # Heuristic checks
-        error_message = ""
-        broken_code = ""
-        
-        if error_blocks:
-            error_message = error_blocks[0]
-        elif q_parser.code_blocks:
-            # Fallback to the first non-code block if no explicit error layout found
-            error_message = q_parser.code_blocks[0]
-            
-        if cpp_code_blocks:
-            broken_code = cpp_code_blocks[0]
-        elif q_parser.code_blocks and len(q_parser.code_blocks) > 1:
-            broken_code = q_parser.code_blocks[1]
-            
-        # Clean up empty components
-        if not error_message:
-            print("  -> Could not isolate compiler error output inside question. Skipping.")
+        if accepted_ans_id not in answers:
+            print("  -> Failed to fetch accepted answer. Skipping.")
             continue
 
-        # Fetch accepted answer body
-        ans_params = {
-            "site": "stackoverflow",
-            "filter": "withbody"
-        }
-        if args.api_key:
-            ans_params["key"] = args.api_key
-            
-        ans_url = f"https://api.stackexchange.com/2.3/answers/{accepted_ans_id}?" + urllib.parse.urlencode(ans_params)
-        
-        # Throttle request rate
-        time.sleep(1.0)
-        
-        ans_data = fetch_api_json(ans_url)
-        if not ans_data or "items" not in ans_data or not ans_data["items"]:
-            print("  -> Failed to fetch accepted answer. Skipping.")
+        data_point, reason = build_record(item, answers[accepted_ans_id])
+        if data_point is None:
+            print(f"  -> {reason}. Skipping.")
             continue
-            
-        ans_item = ans_data["items"][0]
-        ans_body = ans_item["body"]
-        
-        # Parse answer body
-        ans_parser = SOBodyParser()
-        ans_parser.feed(ans_body)
-        
-        explanation = ans_parser.get_clean_text()
-        
-        # Extract corrected code block
-        suggested_code = ""
-        ans_cpp_blocks = [cb for cb in ans_parser.code_blocks if is_likely_cpp_code(cb)]
-        if ans_cpp_blocks:
-            suggested_code = ans_cpp_blocks[0]
-        elif ans_parser.code_blocks:
-            suggested_code = ans_parser.code_blocks[0]
-            
-        # Structure payload
-        data_point = {
-            "id": f"so-question-{q_id}",
-            "compiler": "gcc",  # standard compiler target
-            "error_type": "Compiler Error",
-            "error_message": error_message,
-            "explanation": explanation[:300] + "..." if len(explanation) > 300 else explanation,
-            "suggested_fix": {
-                "type": "code_modification" if suggested_code else "documentation_clarification",
-                "description": "Adjust the implementation based on the Stack Overflow solution.",
-                "code": suggested_code if suggested_code else "Check description for details."
-            }
-        }
-        dataset.append(data_point)
-        print(f"  -> Added successfully. Sample error message length: {len(error_message)}")
+        out.write(json.dumps(data_point, ensure_ascii=False) + "\n")
+        state["records"] += 1
+        print(f"  -> Added successfully. Sample error message length: {len(data_point['error_message'])}")
 
-    if not dataset:
+def crawl(client, state, limit, out, checkpoint_path=None):
+    """
+    Pages through the tagged questions until `limit` questions or the last
+    page, streaming records to the JSONL file `out`. While one page's answers
+    are fetched and parsed, the next question page is already being requested
+    on the other connection. The checkpoint is written after every page with
+    the JSONL size at that point, so a crawl stopped at any point (Ctrl+C, lost
+    connection, quota) resumes at the first unfinished page.
+    """
+    params = {
+        "pagesize": PAGE_SIZE,
+        "order": "desc",
+        "sort": "votes",
+        "tagged": QUESTION_TAGS,
+        "filter": "withbody"  # retrieve question text body
+    }
+
+    def fetch_page(page):
+        return client.get("/questions", dict(params, page=page))
+
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        pending = None
+        while state["has_more"] and state["questions_seen"] < limit:
+            page = state["next_page"]
+            payload = pending.result() if pending is not None else fetch_page(page)
+            pending = None
+
+            questions = payload.get("items", [])[:limit - state["questions_seen"]]
+            has_more = payload.get("has_more", False) and bool(questions)
+            if has_more and state["questions_seen"] + len(questions) < limit:
+                pending = prefetch.submit(fetch_page, page + 1)
+
+            answer_ids = [item["accepted_answer_id"] for item in questions if item.get("accepted_answer_id")]
+            answers, missing = fetch_answers(client, answer_ids)
+            if missing:
+                # Re-parse only: the original crawl stopped inside this page (a smaller --limit),
+                # so keep the questions before the first answer it never downloaded and stop there
+                missing = set(missing)
+                cut = next(i for i, item in enumerate(questions) if item.get("accepted_answer_id") in missing)
+                questions = questions[:cut]
+                has_more = False
+                print(f"Answers past question {state['questions_seen'] + cut} were never downloaded; re-parse stops there.")
+            process_page(state, questions, answers, out)
+            out.flush()
+
+            state["next_page"] = page + 1
+            state["has_more"] = has_more
+            state["jsonl_offset"] = out.tell()
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, state)
+            print(f"--- Page {page} done: {state['questions_seen']} questions, {state['records']} records, "
+                  f"{client.requests} requests, quota remaining {client.quota_remaining} ---")
+
+def export_json(jsonl_path, json_path):
+    """
+    Converts the JSONL stream into the JSON array the rest of the project reads,
+    one record at a time (same layout as json.dump(..., indent=2)).
+    Returns the number of records.
+    """
+    count, _ = write_records(json_path, iter_file(jsonl_path, validate=False))
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape Stack Overflow for C++ compiler errors and fixes.")
+    parser.add_argument("--limit", type=int, default=10, help="Number of questions to pull (paginates past 100).")
+    parser.add_argument("--output", type=str, default="scraped_dataset.json", help="Path to output JSON dataset.")
+    parser.add_argument("--jsonl", type=str, default=None, help="Records are streamed here as they are scraped (default: <output> with .jsonl).")
+    parser.add_argument("--api-key", type=str, default=None, help="StackApps API Key to increase quota limit.")
+    parser.add_argument("--api-base", type=str, default=API_BASE, help="API root URL (point at a local stub server for testing).")
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND, help="Max requests per second.")
+    parser.add_argument("--connections", type=int, default=CONNECTIONS, help="Keep-alive connections to the API.")
+    parser.add_argument("--checkpoint", type=str, default=None, help="Crawl state file (default: <output>.checkpoint.json).")
+    parser.add_argument("--resume", action="store_true", help="Continue the crawl saved in the checkpoint.")
+    parser.add_argument("--cache-dir", type=str, default=CACHE_DIR, help="On-disk cache of raw API responses.")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the response cache.")
+    parser.add_argument("--reparse", action="store_true",
+                        help="Rebuild the dataset offline from the response cache (e.g. after improving the heuristics).")
+    args = parser.parse_args()
+
+    jsonl_path = args.jsonl or os.path.splitext(args.output)[0] + ".jsonl"
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint.json"
+    if args.reparse and args.no_cache:
+        parser.error("--reparse reads the response cache; drop --no-cache")
+
+    resume = args.resume and not args.reparse
+    state = load_checkpoint(checkpoint_path if resume else None)
+    if resume:
+        print(f"Resuming from {checkpoint_path}: page {state['next_page']}, {state['questions_seen']} questions seen.")
+        # Drop records written after the last checkpoint; their page is scraped again
+        if os.path.exists(jsonl_path):
+            os.truncate(jsonl_path, state["jsonl_offset"])
+
+    cache = None if args.no_cache else ResponseCache(args.cache_dir)
+    if args.reparse:
+        print(f"Re-parsing cached responses from {args.cache_dir} (offline, Limit: {args.limit})...")
+    else:
+        print(f"Initializing Stack Overflow API scraper (Limit: {args.limit})...")
+    client = StackExchangeClient(args.api_base, args.api_key, rate=args.rate, connections=args.connections,
+                                 cache=cache, offline=args.reparse)
+    with open(jsonl_path, "a" if resume else "w", encoding="utf-8") as out:
+        try:
+            crawl(client, state, args.limit, out, None if args.reparse else checkpoint_path)
+        except CacheMiss as e:
+            print(f"Stopping re-parse: {e} (everything cached up to here was used).")
+        except QuotaExhausted as e:
+            print(f"Stopping: {e}. Run again with --resume once the quota resets.")
+        except RuntimeError as e:
+            print(f"Stopping: {e}. Run again with --resume to continue from {checkpoint_path}.")
+        except KeyboardInterrupt:
+            print(f"\nInterrupted. Run again with --resume to continue from {checkpoint_path}.")
+        finally:
+            client.close()
+    if cache is not None:
+        print(f"Response cache: {cache.hits} hits, {client.requests} downloads")
+
+    if not state["records"] and not resume:
         print("No valid datasets compiled.")
         return
         
-    print(f"\nSaving {len(dataset)} items to {args.output}...")
-    with open(args.output, "w", encoding="utf-8") as f:
-        json.dump(dataset, f, indent=2)
+    print(f"\nSaving items from {jsonl_path} to {args.output}...")
+    count = export_json(jsonl_path, args.output)
+    print(f"Saved {count} items.")
+
+    if not args.reparse and (not state["has_more"] or state["questions_seen"] >= args.limit):
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path) # crawl finished; nothing left to resume
         
     print("Done!")
 
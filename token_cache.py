@@ -0,0 +1,175 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+import torch
+import transformers
+from torch.utils.data import Dataset
+
+# --- Configuration ---
+CACHE_DIR = "token_cache"     # One sub-directory per (dataset, tokenizer, lengths) combination
+TOKENIZE_BATCH_SIZE = 256     # Examples handed to the (fast) tokenizer per call
+
+def tokenizer_fingerprint(tokenizer):
+    """
+    Identifies a tokenizer by what actually decides its output: class, vocab size,
+    the serialized fast-tokenizer model (merges, normalizer, special tokens) and the
+    transformers version.
+    """
+    digest = hashlib.sha256()
+    digest.update(type(tokenizer).__name__.encode("utf-8"))
+    digest.update(str(len(tokenizer)).encode("utf-8"))
+    digest.update(transformers.__version__.encode("utf-8"))
+    if getattr(tokenizer, "is_fast", False):
+        # Skip the truncation/padding sections: every tokenizer call rewrites them
+        state = json.loads(tokenizer.backend_tokenizer.to_str())
+        state.pop("truncation", None)
+        state.pop("padding", None)
+        digest.update(json.dumps(state, sort_keys=True).encode("utf-8"))
+    else:
+        digest.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def cache_key(data, tokenizer, prefix, max_input_len, max_target_len):
+    """
+    sha256 of the examples, tokenizer fingerprint, prompt prefix and truncation
+    lengths. `data` is any re-iterable of records (a list or a
+    dataset_io.DatasetReader); it is hashed one record at a time, in exactly
+    the bytes json.dumps(list(data), sort_keys=True) would give, so keys match
+    whether the dataset was loaded or streamed.
+    """
+    digest = hashlib.sha256()
+    digest.update(b"[")
+    for position, item in enumerate(data):
+        if position:
+            digest.update(b", ")
+        digest.update(json.dumps(item, sort_keys=True).encode("utf-8"))
+    digest.update(b"]")
+    digest.update(tokenizer_fingerprint(tokenizer).encode("utf-8"))
+    digest.update(f"{prefix}|{max_input_len}|{max_target_len}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def _chunks(data, size):
+    chunk = []
+    for item in data:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _append_ragged(f, sequences, dtype, lengths):
+    """Appends token id lists to an open flat file and records their lengths."""
+    lengths.extend(len(ids) for ids in sequences)
+    np.fromiter((token for ids in sequences for token in ids), dtype=dtype,
+                count=sum(len(ids) for ids in sequences)).tofile(f)
+
+def _offsets(lengths):
+    """Where each example starts and ends in a flat file (len = n + 1)."""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+def build_token_cache(data, tokenizer, prefix, max_input_len=512, max_target_len=256, cache_dir=CACHE_DIR):
+    """
+    Tokenizes every example once (prompt = prefix + error_message, target =
+    explanation + fix description, truncated but NOT padded) and writes:
+    - inputs.bin / labels.bin: all token ids back to back, uint16 when the
+      vocabulary fits (CodeT5's 32k does) and int32 otherwise;
+    - offsets.npy: where each example starts and ends in both files;
+    - meta.json: written last, so a half-written cache is never reused.
+    Returns the cache directory; an existing complete cache is reused as is.
+    `data` is read twice (key, then tokenization) and never held in memory as a
+    whole, so a streamed dataset_io.DatasetReader can be larger than RAM.
+    """
+    path = os.path.join(cache_dir, cache_key(data, tokenizer, prefix, max_input_len, max_target_len))
+    if os.path.exists(os.path.join(path, "meta.json")):
+        print(f"Using tokenized cache {path}")
+        return path
+
+    print(f"Tokenizing examples into {path}...")
+    os.makedirs(path, exist_ok=True)
+    dtype = np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max + 1 else np.int32
+    input_lengths, label_lengths = [], []
+    with open(os.path.join(path, "inputs.bin"), "wb") as inputs, open(os.path.join(path, "labels.bin"), "wb") as labels:
+        for chunk in _chunks(data, TOKENIZE_BATCH_SIZE):
+            _append_ragged(inputs, tokenizer(
+                [prefix + item["error_message"] for item in chunk],
+                max_length=max_input_len, truncation=True
+            )["input_ids"], dtype, input_lengths)
+            _append_ragged(labels, tokenizer(
+                [item["explanation"] + " " + item["suggested_fix"]["description"] for item in chunk],
+                max_length=max_target_len, truncation=True
+            )["input_ids"], dtype, label_lengths)
+    np.save(os.path.join(path, "offsets.npy"), np.stack([_offsets(input_lengths), _offsets(label_lengths)]))
+
+    meta = {
+        "count": len(input_lengths),
+        "dtype": np.dtype(dtype).name,
+        "pad_token_id": tokenizer.pad_token_id,
+        "max_input_len": max_input_len,
+        "max_target_len": max_target_len,
+        "tokenizer": tokenizer_fingerprint(tokenizer),
+        "transformers": transformers.__version__,
+    }
+    with open(os.path.join(path, "meta.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+    return path
+
+class TokenizedDataset(Dataset):
+    """
+    Reads examples from a build_token_cache() directory through np.memmap, so
+    nothing is tokenized during training and DataLoader workers share the
+    page cache instead of each holding a copy. `indices` selects a split.
+    Items come back unpadded; train.DynamicPaddingCollator pads each batch.
+    """
+    def __init__(self, path, indices=None):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.inputs = np.memmap(os.path.join(path, "inputs.bin"), dtype=self.meta["dtype"], mode="r")
+        self.labels = np.memmap(os.path.join(path, "labels.bin"), dtype=self.meta["dtype"], mode="r")
+        self.input_offsets, self.label_offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.indices = list(range(self.meta["count"])) if indices is None else list(indices)
+        self.pad_token_id = self.meta["pad_token_id"]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def lengths(self):
+        """Input + target token count of every item, for length-grouped batching."""
+        input_lens = np.diff(self.input_offsets)[self.indices]
+        label_lens = np.diff(self.label_offsets)[self.indices]
+        return (input_lens + label_lens).tolist()
+
+    def __getitem__(self, index):
+        index = self.indices[index]
+        input_ids = self.inputs[self.input_offsets[index]:self.input_offsets[index + 1]]
+        labels = self.labels[self.label_offsets[index]:self.label_offsets[index + 1]]
+        return {
+            "input_ids": torch.from_numpy(input_ids.astype(np.int64)),
+            "labels": torch.from_numpy(labels.astype(np.int64))
+        }
+
+def main():
+    from transformers import AutoTokenizer
+    from train import MODEL_NAME, PROMPT_PREFIX
+    from dataset_io import DatasetReader
+
+    parser = argparse.ArgumentParser(description="Pre-tokenize a dataset for train.py.")
+    parser.add_argument("--dataset", type=str, nargs="+", default=["generated_dataset.json"],
+                        help="Training dataset files, shard directories or glob patterns (merged, ids deduplicated)")
+    parser.add_argument("--model", type=str, default=MODEL_NAME, help="Tokenizer to use")
+    parser.add_argument("--cache_dir", type=str, default=CACHE_DIR, help="Where tokenized caches are kept")
+    args = parser.parse_args()
+
+    data = DatasetReader(args.dataset)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    path = build_token_cache(data, tokenizer, PROMPT_PREFIX, cache_dir=args.cache_dir)
+    size_mb = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1e6
+    print(f"{TokenizedDataset(path).meta['count']} examples cached in {path} ({size_mb:.2f} MB)")
+
+if __name__ == "__main__":
+    main()
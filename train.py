@@ -1,12 +1,22 @@
-import json
+import os
+import re
 import torch
+import shutil
+import numpy as np
+import contextlib
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
 import random
 from torch.utils.data import Dataset, DataLoader
 from transformers import T5ForConditionalGeneration, AutoTokenizer
 from torch.utils.tensorboard import SummaryWriter
 from torch.optim import AdamW
 import time
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, GroupShuffleSplit
+from token_cache import CACHE_DIR, build_token_cache, TokenizedDataset
+from dataset_io import DatasetReader, SchemaError
+from dedup import find_clusters
+from metrics import GenerationMetrics
 
 # --- Configuration ---
 MODEL_NAME = "Salesforce/codet5-base"
@@ -15,11 +25,16 @@ BATCH_SIZE = 4
 EPOCHS = 10 # We can run for more epochs, we will only save the best
 LEARNING_RATE = 5e-5 
 MODEL_SAVE_PATH = './fine_tuned_t5_compiler_tutor'
+PROMPT_PREFIX = "explain this C++ compiler error, detailing the specific cause and a solution: "
+MAX_INPUT_LEN = 512
+MAX_TARGET_LEN = 256
+CHECKPOINT_DIR = "checkpoints"  # Resumable training state (model, optimizer, sampler position, RNG)
+PRECISIONS = ("fp32", "bf16", "fp16")  # fp16 needs a GPU; bf16 autocast also works on recent CPUs
 
 # --- 1. Your new, improved Dataset Class ---
 # We put it directly inside train.py
 class CompilerErrorDataset(Dataset):
-    def __init__(self, data, tokenizer, max_input_len=512, max_target_len=256):
+    def __init__(self, data, tokenizer, max_input_len=MAX_INPUT_LEN, max_target_len=MAX_TARGET_LEN):
         self.tokenizer = tokenizer
         self.max_input_len = max_input_len
         self.max_target_len = max_target_len
@@ -32,142 +47,605 @@ class CompilerErrorDataset(Dataset):
         item = self.data[index]
         
         # Your new, specific prompt
-        prefix = "explain this C++ compiler error, detailing the specific cause and a solution: "
-        input_text = prefix + item['error_message']
+        input_text = PROMPT_PREFIX + item['error_message']
         
         # Your new, enriched target text
         target_text = item["explanation"] + " " + item["suggested_fix"]["description"]
 
+        # No padding here: DynamicPaddingCollator pads each batch to its own longest item
         tokenized_input = self.tokenizer(
-            input_text, max_length=self.max_input_len, padding='max_length',
+            input_text, max_length=self.max_input_len,
             truncation=True, return_tensors="pt"
         )
         tokenized_target = self.tokenizer(
-            target_text, max_length=self.max_target_len, padding='max_length',
+            target_text, max_length=self.max_target_len,
             truncation=True, return_tensors="pt"
         )
 
         return {
-            "input_ids": tokenized_input["input_ids"].squeeze(), 
-            "attention_mask": tokenized_input["attention_mask"].squeeze(), 
-            "labels": tokenized_target["input_ids"].squeeze()
+            "input_ids": tokenized_input["input_ids"].squeeze(0), 
+            "labels": tokenized_target["input_ids"].squeeze(0)
         }
 
+    def lengths(self):
+        """Character lengths as a cheap stand-in for token counts (used to group batches)."""
+        return [
+            len(item["error_message"]) + len(item["explanation"]) + len(item["suggested_fix"]["description"])
+            for item in self.data
+        ]
+
+# --- 1b. Batching: pad per batch, group similar lengths ---
+class DynamicPaddingCollator:
+    """
+    Pads input_ids to the longest input in the batch (attention_mask marks the
+    real tokens) and labels to the longest target with -100, which the T5 loss
+    ignores, so pad positions cost neither FLOPs nor gradient.
+    """
+    def __init__(self, pad_token_id):
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, items):
+        input_len = max(len(item["input_ids"]) for item in items)
+        label_len = max(len(item["labels"]) for item in items)
+
+        input_ids = torch.full((len(items), input_len), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(items), input_len), dtype=torch.long)
+        labels = torch.full((len(items), label_len), -100, dtype=torch.long)
+        for row, item in enumerate(items):
+            input_ids[row, :len(item["input_ids"])] = item["input_ids"]
+            attention_mask[row, :len(item["input_ids"])] = 1
+            labels[row, :len(item["labels"])] = item["labels"]
+
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+
+class LengthGroupedSampler:
+    """
+    Batch sampler that puts examples of similar length in the same batch.
+    Each epoch the indices are shuffled, cut into windows of
+    batch_size * BUCKET_BATCHES examples, each window is sorted by length and
+    split into batches, and finally the batch order is shuffled. Batches stay
+    random from epoch to epoch but carry little padding.
+    With shuffle=False (validation) everything is simply sorted by length.
+
+    Under DDP every rank builds the same batch list (same seed and epoch) and
+    keeps every num_replicas-th batch, like DistributedSampler does for single
+    indices. The list is padded by repeating batches so all ranks run the same
+    number of steps; otherwise the gradient all-reduce would hang.
+
+    set_epoch(epoch, start_batch) skips batches already trained on, which is
+    how a resumed run continues mid-epoch without loading them again.
+    """
+    BUCKET_BATCHES = 50
+
+    def __init__(self, lengths, batch_size, shuffle=True, seed=42, num_replicas=1, rank=0):
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_epoch(self, epoch, start_batch=0):
+        """Reseeds the shuffle, so every epoch differs but a run is reproducible."""
+        self.epoch = epoch
+        self.start_batch = start_batch
+
+    def batches_per_epoch(self):
+        """Batches this rank runs in a full epoch."""
+        total_batches = (len(self.lengths) + self.batch_size - 1) // self.batch_size
+        return (total_batches + self.num_replicas - 1) // self.num_replicas
+
+    def __len__(self):
+        return self.batches_per_epoch() - self.start_batch
+
+    def _batches(self):
+        indices = list(range(len(self.lengths)))
+        if not self.shuffle:
+            indices.sort(key=lambda i: self.lengths[i])
+            return [indices[i:i + self.batch_size] for i in range(0, len(indices), self.batch_size)]
+
+        rng = random.Random(self.seed + self.epoch)
+        rng.shuffle(indices)
+        window = self.batch_size * self.BUCKET_BATCHES
+        batches = []
+        for start in range(0, len(indices), window):
+            bucket = sorted(indices[start:start + window], key=lambda i: self.lengths[i], reverse=True)
+            batches += [bucket[i:i + self.batch_size] for i in range(0, len(bucket), self.batch_size)]
+        rng.shuffle(batches)
+        return batches
+
+    def __iter__(self):
+        batches = self._batches()
+        if self.num_replicas > 1:
+            batches += batches[:self.batches_per_epoch() * self.num_replicas - len(batches)]
+            batches = batches[self.rank::self.num_replicas]
+        return iter(batches[self.start_batch:])
+
+def autocast_context(device, precision):
+    """Autocast for bf16/fp16 mixed precision, or a no-op context for fp32."""
+    if precision == "fp32":
+        return contextlib.nullcontext()
+    dtype = torch.bfloat16 if precision == "bf16" else torch.float16
+    return torch.autocast(device_type=device.type, dtype=dtype)
+
+def setup_distributed(backend):
+    """
+    Joins the process group when launched by torchrun (which sets WORLD_SIZE,
+    RANK and LOCAL_RANK). Returns (rank, world_size, local_rank); (0, 1, 0)
+    for a plain `python train.py` run.
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size == 1:
+        return 0, 1, 0
+    dist.init_process_group(backend=backend)
+    return dist.get_rank(), world_size, int(os.environ.get("LOCAL_RANK", 0))
+
+def all_reduce_sum(*values):
+    """Sums Python numbers across all ranks (returned unchanged without DDP)."""
+    if not dist.is_initialized():
+        return values
+    tensor = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tuple(tensor.tolist())
+
+# --- 1c. Generation-based evaluation ---
+class GenerationEvaluator:
+    """
+    Batched greedy generation over (this rank's share of) the validation split,
+    scored against the reference targets with metrics.py. The padded input
+    batches and the reference ids are built from the dataset once and kept,
+    so later evaluations don't tokenize or collate anything again.
+    """
+    def __init__(self, dataset, batch_size, pad_token_id, special_ids, num_replicas=1, rank=0):
+        self.dataset = dataset
+        self.sampler = LengthGroupedSampler(dataset.lengths(), batch_size, shuffle=False,
+                                            num_replicas=num_replicas, rank=rank)
+        self.collator = DynamicPaddingCollator(pad_token_id)
+        self.special_ids = set(special_ids)
+        self.batches = None
+
+    def _strip(self, ids):
+        return [token for token in ids if token not in self.special_ids]
+
+    def _prepare(self):
+        self.batches = []
+        for indices in self.sampler:
+            items = [self.dataset[i] for i in indices]
+            batch = self.collator(items)
+            references = [self._strip(item["labels"].tolist()) for item in items]
+            self.batches.append((batch["input_ids"], batch["attention_mask"], references))
+
+    def evaluate(self, model, device, precision, max_new_tokens):
+        """Returns BLEU, ROUGE-L and exact match over all ranks, plus examples/sec and generated tokens/sec."""
+        if self.batches is None:
+            self._prepare()
+
+        metrics = GenerationMetrics()
+        generated_tokens = 0
+        start = time.time()
+        model.eval()
+        with torch.no_grad():
+            for input_ids, attention_mask, references in self.batches:
+                with autocast_context(device, precision):
+                    outputs = model.generate(
+                        input_ids=input_ids.to(device), attention_mask=attention_mask.to(device),
+                        max_new_tokens=max_new_tokens, num_beams=1, do_sample=False
+                    )
+                for output, reference in zip(outputs.tolist(), references):
+                    generated = self._strip(output)
+                    generated_tokens += len(generated)
+                    metrics.add(generated, reference)
+        seconds = time.time() - start
+
+        totals = all_reduce_sum(*metrics.totals(), generated_tokens)
+        metrics = GenerationMetrics.from_totals(totals[:-1])
+        scores = metrics.compute()
+        scores["examples_per_sec"] = metrics.count / seconds
+        scores["tokens_per_sec"] = totals[-1] / seconds
+        return scores
+
+# --- 1d. Checkpoints ---
+CHECKPOINT_RE = re.compile(r"^checkpoint-(\d+)\.pt$")
+
+def capture_rng_state():
+    """RNG states of every generator training draws from (dropout, shuffles)."""
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+def restore_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+def list_checkpoints(checkpoint_dir):
+    """Checkpoint paths in checkpoint_dir, oldest first."""
+    if not os.path.isdir(checkpoint_dir):
+        return []
+    found = []
+    for name in os.listdir(checkpoint_dir):
+        match = CHECKPOINT_RE.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(checkpoint_dir, name)))
+    return [path for _, path in sorted(found)]
+
+def save_checkpoint(checkpoint_dir, state, keep):
+    """
+    Writes checkpoint-<global_step>.pt atomically (temp file + os.replace, so a
+    kill mid-write never leaves a truncated checkpoint behind) and deletes all
+    but the newest `keep` checkpoints.
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = os.path.join(checkpoint_dir, f"checkpoint-{state['global_step']:08d}.pt")
+    tmp_path = path + ".tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+    for old_path in list_checkpoints(checkpoint_dir)[:-keep]:
+        os.remove(old_path)
+    return path
+
+def save_best_model(model, tokenizer, save_path):
+    """save_pretrained into a sibling directory, then swap it in, so a crash never leaves a half-written model."""
+    tmp_path = save_path.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    model.save_pretrained(tmp_path)
+    tokenizer.save_pretrained(tmp_path)
+    shutil.rmtree(save_path, ignore_errors=True)
+    os.replace(tmp_path, save_path)
+
 # --- 2. The Main Training Logic ---
 
 def main():
     import argparse
     parser = argparse.ArgumentParser(description="Train CodeT5 C++ Compiler Tutor")
-    parser.add_argument("--dataset", type=str, default="generated_dataset.json", help="Path to the training JSON dataset")
+    parser.add_argument("--dataset", type=str, nargs="+", default=["generated_dataset.json"],
+                        help="Training dataset files, shard directories or glob patterns (.json/.jsonl, optionally .gz/.zst); merged with ids deduplicated")
     parser.add_argument("--epochs", type=int, default=10, help="Number of epochs to train")
     parser.add_argument("--batch_size", type=int, default=4, help="Batch size for training")
     parser.add_argument("--lr", type=float, default=5e-5, help="Learning rate")
+    parser.add_argument("--token_cache_dir", type=str, default=CACHE_DIR, help="Where pre-tokenized datasets are cached")
+    parser.add_argument("--no_token_cache", action="store_true", help="Tokenize every item on the fly instead (old behaviour)")
+    parser.add_argument("--no_group_split", action="store_true", help="Split examples at random instead of keeping near-duplicate clusters on one side")
+    parser.add_argument("--precision", type=str, default="fp32", choices=PRECISIONS, help="Mixed-precision autocast dtype")
+    parser.add_argument("--grad_accum_steps", type=int, default=1, help="Batches per optimizer step (effective batch = batch_size * this)")
+    parser.add_argument("--num_workers", type=int, default=0, help="DataLoader worker processes")
+    parser.add_argument("--pin_memory", action="store_true", help="Pin batch memory for faster host-to-GPU copies")
+    parser.add_argument("--persistent_workers", action="store_true", help="Keep DataLoader workers alive between epochs")
+    parser.add_argument("--torch_threads", type=int, default=None, help="Intra-op CPU threads for torch (default: torch's choice, split between local ranks under DDP)")
+    parser.add_argument("--ddp_backend", type=str, default="gloo", choices=["gloo", "nccl"], help="Process group backend under torchrun (gloo works on CPU)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the train/val split and batch shuffling (must match across ranks)")
+    parser.add_argument("--checkpoint_dir", type=str, default=CHECKPOINT_DIR, help="Where resumable checkpoints are written")
+    parser.add_argument("--checkpoint_every", type=int, default=200, help="Optimizer steps between checkpoints (0 = only at epoch ends)")
+    parser.add_argument("--keep_checkpoints", type=int, default=3, help="Newest checkpoints kept on disk")
+    parser.add_argument("--resume", nargs="?", const="latest", default=None,
+                        help="Resume from a checkpoint file, or the newest one in --checkpoint_dir if no path is given")
+    parser.add_argument("--early_stopping_patience", type=int, default=0,
+                        help="Stop after this many epochs without validation improvement (0 = never)")
+    parser.add_argument("--min_delta", type=float, default=0.0, help="Smallest validation loss drop that counts as an improvement")
+    parser.add_argument("--eval_every", type=int, default=1, help="Epochs between generation-based evaluations (0 = off)")
+    parser.add_argument("--eval_batch_size", type=int, default=32, help="Batch size for generation during evaluation")
+    parser.add_argument("--eval_max_new_tokens", type=int, default=MAX_TARGET_LEN, help="Generation length limit during evaluation")
     args = parser.parse_args()
+    if args.keep_checkpoints < 1:
+        parser.error("--keep_checkpoints must be at least 1 (the newest checkpoint is what --resume loads)")
 
     FILE_PATH = args.dataset
     EPOCHS = args.epochs
     BATCH_SIZE = args.batch_size
     LEARNING_RATE = args.lr
 
-    # 1. Setup Device
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"Using device: {device}")
+    # 1. Setup Device (and the process group when launched with torchrun)
+    rank, world_size, local_rank = setup_distributed(args.ddp_backend)
+    is_main = rank == 0
+    log = print if is_main else (lambda *a, **k: None) # only rank 0 reports
+
+    if torch.cuda.is_available():
+        device = torch.device("cuda", local_rank)
+        torch.cuda.set_device(device)
+    else:
+        device = torch.device("cpu")
+    log(f"Using device: {device}" + (f" | DDP: {world_size} ranks ({args.ddp_backend})" if world_size > 1 else ""))
+
+    if args.torch_threads:
+        torch.set_num_threads(args.torch_threads)
+    elif world_size > 1 and device.type == "cpu":
+        # Local ranks would otherwise each start one thread per core and oversubscribe the box
+        local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", world_size))
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+    log(f"Torch CPU threads: {torch.get_num_threads()}")
+
+    if args.precision == "fp16" and device.type != "cuda":
+        log("fp16 autocast needs a GPU; using bf16 on CPU instead.")
+        args.precision = "bf16"
+    # fp16 gradients can underflow, so they are scaled; bf16 has fp32's range and needs no scaler
+    scaler = torch.amp.GradScaler(device.type, enabled=args.precision == "fp16")
+    log(f"Precision: {args.precision} | Effective batch size: {BATCH_SIZE * args.grad_accum_steps * world_size}")
 
     # 2. Load Tokenizer and Model
-    print(f"Loading model and tokenizer: {MODEL_NAME}")
+    log(f"Loading model and tokenizer: {MODEL_NAME}")
     tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
     model = T5ForConditionalGeneration.from_pretrained(MODEL_NAME)
     model.to(device)
+    unwrapped_model = model # what gets saved: the plain model, not the DDP wrapper
+    if world_size > 1:
+        model = DistributedDataParallel(model, device_ids=[local_rank] if device.type == "cuda" else None)
 
     # 3. Load Data
-    print(f"Loading data from {FILE_PATH}...")
+    log(f"Loading data from {', '.join(FILE_PATH)}...")
     try:
-        with open(FILE_PATH, 'r', encoding='utf-8') as f:
-            raw_data = json.load(f)
-    except FileNotFoundError:
-        print(f"Error: {FILE_PATH} not found. Make sure the dataset exists.")
+        # Resolving the files up front makes a missing dataset fail on every rank alike
+        reader = DatasetReader(FILE_PATH)
+    except FileNotFoundError as e:
+        print(f"Error: {e.filename} not found. Make sure the dataset exists.")
         return
-        
-    print(f"Loaded {len(raw_data)} total examples.")
+
+    try:
+        if args.no_token_cache:
+            raw_data = list(reader) # tokenized on the fly, so the records stay in memory
+            num_examples = len(raw_data)
+        else:
+            # Tokenize once (or reuse an earlier run's cache) and read batches from memory-mapped ids.
+            # The records are streamed into the cache, never all held in memory.
+            # Rank 0 builds the cache while the other ranks wait, then they all reuse it.
+            if is_main:
+                cache_path = build_token_cache(reader, tokenizer, PROMPT_PREFIX, MAX_INPUT_LEN, MAX_TARGET_LEN, args.token_cache_dir)
+            if world_size > 1:
+                dist.barrier()
+            if not is_main:
+                cache_path = build_token_cache(reader, tokenizer, PROMPT_PREFIX, MAX_INPUT_LEN, MAX_TARGET_LEN, args.token_cache_dir)
+            num_examples = TokenizedDataset(cache_path).meta["count"]
+    except SchemaError as e:
+        print(f"Error: {e}")
+        return
+
+    log(f"Loaded {num_examples} total examples.")
+    if reader.duplicates:
+        log(f"Skipped {reader.duplicates} records with repeated ids ({reader.conflicts} with different content; the first was kept).")
 
     # --- 4. CRITICAL FIX: Shuffle and Split the Data ---
-    print("Shuffling and splitting data...")
+    log("Shuffling and splitting data...")
     
-    # First, shuffle the entire dataset to break lazy patterns
-    random.shuffle(raw_data) 
+    # First, shuffle the entire dataset to break lazy patterns.
+    # Indices are shuffled rather than raw_data, so the tokenized cache (keyed
+    # on the file's order) stays valid across runs. The shuffle is seeded so
+    # every DDP rank computes the same split.
+    indices = list(range(num_examples))
+    random.Random(args.seed).shuffle(indices)
     
     # Split: 80% for training, 20% for validation (the "quiz")
-    train_data, val_data = train_test_split(raw_data, test_size=0.2, random_state=42)
-    print(f"Training on {len(train_data)} examples, validating on {len(val_data)} examples.")
+    if args.no_group_split:
+        train_indices, val_indices = train_test_split(indices, test_size=0.2, random_state=args.seed)
+    else:
+        # Near-duplicates (the same mistake with other file names or line numbers) form one
+        # cluster, and a whole cluster goes to one side, so validation never scores copies
+        # of training examples. 20% of the clusters are held out.
+        clusters = find_clusters(raw_data if args.no_token_cache else reader)
+        log(f"Found {len(set(clusters))} near-duplicate clusters among {num_examples} examples.")
+        splitter = GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=args.seed)
+        train_positions, val_positions = next(splitter.split(indices, groups=[clusters[i] for i in indices]))
+        train_indices = [indices[p] for p in train_positions]
+        val_indices = [indices[p] for p in val_positions]
+    log(f"Training on {len(train_indices)} examples, validating on {len(val_indices)} examples.")
 
-    train_dataset = CompilerErrorDataset(train_data, tokenizer)
-    val_dataset = CompilerErrorDataset(val_data, tokenizer)
+    if args.no_token_cache:
+        train_dataset = CompilerErrorDataset([raw_data[i] for i in train_indices], tokenizer)
+        val_dataset = CompilerErrorDataset([raw_data[i] for i in val_indices], tokenizer)
+    else:
+        train_dataset = TokenizedDataset(cache_path, train_indices)
+        val_dataset = TokenizedDataset(cache_path, val_indices)
     
-    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE)
+    collator = DynamicPaddingCollator(tokenizer.pad_token_id)
+    train_sampler = LengthGroupedSampler(train_dataset.lengths(), BATCH_SIZE, shuffle=True, seed=args.seed,
+                                         num_replicas=world_size, rank=rank)
+    val_sampler = LengthGroupedSampler(val_dataset.lengths(), BATCH_SIZE, shuffle=False,
+                                       num_replicas=world_size, rank=rank)
+    if args.num_workers > 0 and args.no_token_cache:
+        # The fast tokenizer's own thread pool doesn't survive being forked into workers
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    loader_options = {
+        "collate_fn": collator,
+        "num_workers": args.num_workers,
+        "pin_memory": args.pin_memory and device.type == "cuda",
+        "persistent_workers": args.persistent_workers and args.num_workers > 0,
+        # Own generator for worker seeds: starting an epoch then never consumes the global
+        # torch RNG, so a resumed run sees the same dropout masks as an uninterrupted one
+        "generator": torch.Generator().manual_seed(args.seed),
+    }
+    train_loader = DataLoader(train_dataset, batch_sampler=train_sampler, **loader_options)
+    val_loader = DataLoader(val_dataset, batch_sampler=val_sampler, **loader_options)
+    evaluator = GenerationEvaluator(val_dataset, args.eval_batch_size, tokenizer.pad_token_id, tokenizer.all_special_ids,
+                                    num_replicas=world_size, rank=rank)
     
     # 5. Initialize Optimizer
     optimizer = AdamW(model.parameters(), lr=LEARNING_RATE)
 
-    # 6. Setup TensorBoard
-    log_dir = f"runs/{time.strftime('%Y-%m-%d_%H-%M-%S')}"
-    writer = SummaryWriter(log_dir)
-    print(f"TensorBoard log directory: {log_dir}")
+    # 5b. Resume: model, optimizer, scaler, RNG and where in the data we stopped
+    start_epoch, start_batch, global_step = 0, 0, 0
+    best_val_loss = float('inf') # Track the best "quiz score"
+    epochs_without_improvement = 0
+    epoch_totals = [0.0, 0, 0, 0] # loss sum, batches, samples, tokens of a partly finished epoch
+    if args.resume:
+        resume_path = args.resume
+        if resume_path == "latest":
+            checkpoints = list_checkpoints(args.checkpoint_dir)
+            resume_path = checkpoints[-1] if checkpoints else None
+        if resume_path is None:
+            log(f"No checkpoint found in {args.checkpoint_dir}; starting from scratch.")
+        else:
+            log(f"Resuming from {resume_path}")
+            checkpoint = torch.load(resume_path, map_location="cpu", weights_only=False)
+            if checkpoint["world_size"] != world_size or checkpoint["batch_size"] != BATCH_SIZE:
+                log("Warning: world size or batch size changed since the checkpoint; the mid-epoch position is approximate.")
+            unwrapped_model.load_state_dict(checkpoint["model"])
+            optimizer.load_state_dict(checkpoint["optimizer"])
+            scaler.load_state_dict(checkpoint["scaler"])
+            restore_rng_state(checkpoint["rng"])
+            start_epoch = checkpoint["epoch"]
+            start_batch = checkpoint["batch"]
+            global_step = checkpoint["global_step"]
+            best_val_loss = checkpoint["best_val_loss"]
+            epochs_without_improvement = checkpoint["epochs_without_improvement"]
+            epoch_totals = checkpoint["epoch_totals"]
+            log(f"Continuing at epoch {start_epoch + 1}, batch {start_batch} (optimizer step {global_step})")
+
+    def checkpoint_state(epoch, batch, totals):
+        """Everything needed to continue exactly here; `epoch`/`batch` is the next batch to train on."""
+        return {
+            "model": unwrapped_model.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "scaler": scaler.state_dict(),
+            "rng": capture_rng_state(),
+            "epoch": epoch,
+            "batch": batch,
+            "global_step": global_step,
+            "best_val_loss": best_val_loss,
+            "epochs_without_improvement": epochs_without_improvement,
+            "epoch_totals": totals,
+            "world_size": world_size,
+            "batch_size": BATCH_SIZE,
+            "args": vars(args),
+        }
+
+    # 6. Setup TensorBoard (rank 0 only)
+    writer = None
+    if is_main:
+        log_dir = f"runs/{time.strftime('%Y-%m-%d_%H-%M-%S')}"
+        writer = SummaryWriter(log_dir)
+        log(f"TensorBoard log directory: {log_dir}")
 
     # --- 7. The Upgraded Training Loop ---
-    print("########### Starting Training #########")
+    log("########### Starting Training #########")
     
-    best_val_loss = float('inf') # Track the best "quiz score"
-    
-    for epoch in range(EPOCHS):
+    steps_per_epoch = train_sampler.batches_per_epoch()
+    for epoch in range(start_epoch, EPOCHS):
         # --- Training Phase ---
         model.train()
-        total_train_loss = 0
-        for batch in train_loader:
-            optimizer.zero_grad()
-            input_ids = batch['input_ids'].to(device)
-            attention_mask = batch['attention_mask'].to(device)
-            labels = batch['labels'].to(device)
+        first_batch = start_batch if epoch == start_epoch else 0
+        train_sampler.set_epoch(epoch, first_batch)
+        if first_batch:
+            total_train_loss, train_batches, train_samples, train_tokens = epoch_totals
+        else:
+            total_train_loss, train_batches, train_samples, train_tokens = 0.0, 0, 0, 0 # tokens: real (non-pad) input + target
+        epoch_start = time.time()
+        optimizer.zero_grad()
+        for step, batch in enumerate(train_loader, start=first_batch):
+            input_ids = batch['input_ids'].to(device, non_blocking=True)
+            attention_mask = batch['attention_mask'].to(device, non_blocking=True)
+            labels = batch['labels'].to(device, non_blocking=True)
             
-            outputs = model(input_ids=input_ids, attention_mask=attention_mask, labels=labels)
+            with autocast_context(device, args.precision):
+                outputs = model(input_ids=input_ids, attention_mask=attention_mask, labels=labels)
             
             loss = outputs.loss
-            loss.backward()
-            optimizer.step()
+            # Average over the accumulated batches so the step matches one big batch.
+            # Under DDP, gradients are only all-reduced on the batch that steps.
+            is_step = (step + 1) % args.grad_accum_steps == 0 or step + 1 == steps_per_epoch
+            with model.no_sync() if world_size > 1 and not is_step else contextlib.nullcontext():
+                scaler.scale(loss / args.grad_accum_steps).backward()
+            if is_step:
+                scaler.step(optimizer)
+                scaler.update()
+                optimizer.zero_grad()
+                global_step += 1
             total_train_loss += loss.item()
+            train_batches += 1
+            train_samples += input_ids.size(0)
+            train_tokens += int(attention_mask.sum()) + int((labels != -100).sum())
+
+            # Only after an optimizer step, so no half-accumulated gradients need saving
+            if is_step and args.checkpoint_every and global_step % args.checkpoint_every == 0 and step + 1 < steps_per_epoch:
+                if is_main:
+                    save_checkpoint(args.checkpoint_dir, checkpoint_state(
+                        epoch, step + 1, [total_train_loss, train_batches, train_samples, train_tokens]
+                    ), args.keep_checkpoints)
         
-        avg_train_loss = total_train_loss / len(train_loader)
-        writer.add_scalar("Training Loss", avg_train_loss, epoch + 1)
+        train_seconds = time.time() - epoch_start
+        # Totals over all ranks (each one only saw its shard); a resumed epoch only times the part run now
+        resumed_samples = epoch_totals[2] if first_batch else 0
+        resumed_tokens = epoch_totals[3] if first_batch else 0
+        total_train_loss, train_batches, train_samples, train_tokens, resumed_samples, resumed_tokens = all_reduce_sum(
+            total_train_loss, train_batches, train_samples, train_tokens, resumed_samples, resumed_tokens
+        )
+        tokens_per_sec = (train_tokens - resumed_tokens) / train_seconds
+        samples_per_sec = (train_samples - resumed_samples) / train_seconds
+        avg_train_loss = total_train_loss / train_batches
+        if is_main:
+            writer.add_scalar("Training Loss", avg_train_loss, epoch + 1)
+            writer.add_scalar("Throughput/tokens_per_sec", tokens_per_sec, epoch + 1)
+            writer.add_scalar("Throughput/samples_per_sec", samples_per_sec, epoch + 1)
+            writer.add_scalar("Time/epoch_seconds", train_seconds, epoch + 1)
         
         # --- Validation Phase (The "Quiz") ---
         model.eval()
         total_val_loss = 0
+        val_batches = 0
         with torch.no_grad():
             for batch in val_loader:
                 input_ids = batch['input_ids'].to(device)
                 attention_mask = batch['attention_mask'].to(device)
                 labels = batch['labels'].to(device)
                 
-                outputs = model(input_ids=input_ids, attention_mask=attention_mask, labels=labels)
+                with autocast_context(device, args.precision):
+                    outputs = unwrapped_model(input_ids=input_ids, attention_mask=attention_mask, labels=labels)
                 
                 loss = outputs.loss
                 total_val_loss += loss.item()
+                val_batches += 1
         
-        avg_val_loss = total_val_loss / len(val_loader)
-        writer.add_scalar("Validation Loss", avg_val_loss, epoch + 1)
+        # Every rank gets the same average, so they all agree on "improved" below
+        total_val_loss, val_batches = all_reduce_sum(total_val_loss, val_batches)
+        avg_val_loss = total_val_loss / val_batches
+        if is_main:
+            writer.add_scalar("Validation Loss", avg_val_loss, epoch + 1)
         
-        print(f"Epoch: {epoch + 1}/{EPOCHS} | Avg Train Loss: {avg_train_loss:.4f} | Avg Val Loss: {avg_val_loss:.4f}")
+        log(f"Epoch: {epoch + 1}/{EPOCHS} | Avg Train Loss: {avg_train_loss:.4f} | Avg Val Loss: {avg_val_loss:.4f} | {train_seconds:.1f}s, {samples_per_sec:.1f} samples/sec, {tokens_per_sec:.0f} tokens/sec")
+
+        # --- 7b. Generation Quality (every --eval_every epochs) ---
+        if args.eval_every and (epoch + 1) % args.eval_every == 0:
+            scores = evaluator.evaluate(unwrapped_model, device, args.precision, args.eval_max_new_tokens)
+            log(f"  Eval: BLEU {scores['bleu']:.4f} | ROUGE-L {scores['rouge_l']:.4f} | Exact {scores['exact_match']:.2%} | "
+                f"{scores['examples_per_sec']:.1f} examples/sec, {scores['tokens_per_sec']:.0f} tokens/sec")
+            if is_main:
+                writer.add_scalar("Eval/bleu", scores["bleu"], epoch + 1)
+                writer.add_scalar("Eval/rouge_l", scores["rouge_l"], epoch + 1)
+                writer.add_scalar("Eval/exact_match", scores["exact_match"], epoch + 1)
+                writer.add_scalar("Eval/examples_per_sec", scores["examples_per_sec"], epoch + 1)
+                writer.add_scalar("Eval/tokens_per_sec", scores["tokens_per_sec"], epoch + 1)
 
         # --- 8. Save Only the Best Model ---
-        if avg_val_loss < best_val_loss:
-            print(f"Validation loss improved! Saving model to {MODEL_SAVE_PATH}")
+        if avg_val_loss < best_val_loss - args.min_delta:
+            log(f"Validation loss improved! Saving model to {MODEL_SAVE_PATH}")
             best_val_loss = avg_val_loss
-            model.save_pretrained(MODEL_SAVE_PATH)
-            tokenizer.save_pretrained(MODEL_SAVE_PATH)
+            epochs_without_improvement = 0
+            if is_main:
+                save_best_model(unwrapped_model, tokenizer, MODEL_SAVE_PATH)
+        else:
+            epochs_without_improvement += 1
+
+        # End-of-epoch checkpoint: resuming from it starts the next epoch
+        if is_main:
+            save_checkpoint(args.checkpoint_dir, checkpoint_state(epoch + 1, 0, [0.0, 0, 0, 0]), args.keep_checkpoints)
+
+        # --- 9. Early Stopping ---
+        if args.early_stopping_patience and epochs_without_improvement >= args.early_stopping_patience:
+            log(f"No improvement for {epochs_without_improvement} epochs; stopping early.")
+            break
             
-    writer.close()
-    print("----------- Completed with Training -----------")
-    print(f"Best validation loss: {best_val_loss:.4f}")
+    if is_main:
+        writer.close()
+    log("----------- Completed with Training -----------")
+    log(f"Best validation loss: {best_val_loss:.4f}")
+    if world_size > 1:
+        dist.destroy_process_group()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,12 +1,30 @@
-import subprocess
+import os
 import sys
-import torch
-from inference import explain_error, load_model
+from inference import iter_explanations, stream_explanation, load_model, enable_retrieval
+from diagnostics import diagnose_command, error_prompts
 
 #config
 
 MODEL_PATH = "./fine_tuned_t5_compiler_tutor"
+MODEL_BACKEND = "pytorch"  # "pytorch", "int8" or "onnx" (point MODEL_PATH at the convert_model.py output)
 COMPILER_TO_USE = "g++"
+STREAM_TOKENS = True  # Print the first explanation as it's generated (greedy); False = beam search only
+RETRIEVAL_INDEX = "retrieval_index"  # Built by retrieval.py; used only if present
+SHOW_TIMINGS = bool(os.environ.get("TUTOR_TIMINGS"))  # Set TUTOR_TIMINGS=1 to print per-stage compile times
+
+def explain_prompts(prompts):
+    """
+    Yields (index, explanation) for each prompt. With STREAM_TOKENS the first
+    (root-cause) explanation is a generator of text pieces to print as they
+    arrive; the rest come from one batched call, labelled as their batch finishes.
+    """
+    texts = [prompt for _, prompt in prompts]
+    if STREAM_TOKENS:
+        yield 0, stream_explanation(texts[0])
+        for index, friendly_explanation in iter_explanations(texts[1:]):
+            yield index + 1, friendly_explanation
+    else:
+        yield from iter_explanations(texts)
 
 def main():
     args = sys.argv[1:]
@@ -17,55 +35,51 @@ def main():
         sys.exit(1)
 
 
-    load_model()
-
-    #build and run real compiler command
+    load_model(MODEL_PATH, MODEL_BACKEND)
+    if os.path.isdir(RETRIEVAL_INDEX):
+        enable_retrieval(RETRIEVAL_INDEX)
 
+    #build and run real compiler command, behind a -fsyntax-only pre-check
     command = [COMPILER_TO_USE] + args
     print(f"--- Running compiler : {' '.join(command)} ---")
 
-    #subprocess for running executing the command
-    result = subprocess.run(
-        command,
-        capture_output=True,
-        text = True
-    ) 
+    result = diagnose_command(args, compiler=COMPILER_TO_USE)
+    if SHOW_TIMINGS:
+        print(f"--- Compile stages : {result.format_timings()} ---")
 
     compile_error_message = result.stderr
 
-    if not compile_error_message:
-        #Success
+    if result.returncode == 0:
+        #Success (warnings, if any, are still explained below)
         print("--- Compile successful ---")
         if result.stdout:
             print(result.stdout)
-    else:
-        #Failure
-        print("--- Original Compiler error ---")
+    elif not compile_error_message.strip():
+        compile_error_message = f"{COMPILER_TO_USE} exited with code {result.returncode} without printing a diagnostic."
+
+    if compile_error_message:
+        #Errors (or warnings)
+        print("--- Original Compiler error ---" if result.returncode else "--- Compiler warnings ---")
         print(compile_error_message)
 
         #AI mode
-        #clean the error first
-        filename = None
-
-        for arg in args:
-            if arg.endswith(".cpp") or arg.endswith(".c"):
-                filename = arg.split('/')[-1].split('\\')[-1]
-
-        clean_error = ""
-        if filename:
-            essential_lines = []
-            for line in compile_error_message.splitlines():
-                if filename in line:
-                    essential_lines.append(line)
-                
-            clean_error = "\n".join(essential_lines)
-        else:
-            clean_error = compile_error_message
+        #clean the error first: each distinct root-cause error plus its relevant notes
+        prompts = error_prompts(result.diagnostics)
+        if not prompts:
+            prompts = [(None, compile_error_message)]
         try:
             
             print("--- Friendly explanation ---")
-            friendly_explanation = explain_error(clean_error)
-            print(friendly_explanation)
+            for index, friendly_explanation in explain_prompts(prompts):
+                diagnostic = prompts[index][0]
+                if len(prompts) > 1 and diagnostic is not None:
+                    print(f"[{index + 1}] {diagnostic.location()}: {diagnostic.message}")
+                if isinstance(friendly_explanation, str):
+                    print(friendly_explanation, flush=True)
+                else:
+                    for piece in friendly_explanation:
+                        print(piece, end="", flush=True)
+                    print()
         except Exception as e:
             print(f"Error calling the model : {e}")
     